@@ -21,9 +21,8 @@ def plot_model_lifecycle_growth(res, age=36, label="Benchmark Model", _ax=None):
                                      color="grey", alpha=0.3, label=False, _ax=ax)
 
     init_avgsize = res.stat.average_entrant_size_include_cf
-    lifeage = range(1, age+1)
     lifeage_label = range(0, age)
-    lifecycle_growth_rate = [1+res.calculate_survival_stat(age=a)[1]/100 for a in lifeage]
+    lifecycle_growth_rate = 1 + res.cohort_path(age)[1] / 100
     lifecycle_avgsize = [init_avgsize * g for g in lifecycle_growth_rate]
     ax.plot(lifeage_label, lifecycle_avgsize, label=label)
 
@@ -43,9 +42,8 @@ def plot_model_lifecycle_survival(res, age=36, label="Benchmark Model", _ax=None
         ax = _ax
     else:
         fig, ax = plt.subplots()
-    lifeage = range(1, age+1)
     lifeage_label = range(0, age)
-    survival_rate = [res.calculate_survival_stat(age=a)[0] for a in lifeage]
+    survival_rate = res.cohort_path(age)[0]
     ax.plot(lifeage_label, survival_rate, label=label)
 
     if not _ax:
@@ -5,17 +5,118 @@ Hopenhayn model in general equilibrium with firing cost.
 
 
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Any
 
 import numpy as np
 import scipy as sp
-import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional and only required by backend="numba"
+    njit = None
 
 from hopenhayn import Hopenhayn, Result
 
 Array = Any
 
 
+def _max_labor_choice(payoff, c_adjust):
+    """
+    Compiled max over n1 without the 3-D (s, n0, n1) tensor, i.e. for every (s, n0)
+    max_n1 payoff[s, n1] - c_adjust[n0, n1], returning the max and its (first) argmax.
+    """
+    s_size, n_size = payoff.shape
+    v_new = np.empty((s_size, n_size))
+    n1_index = np.empty((s_size, n_size), dtype=np.int64)
+    for i in range(s_size):
+        for j in range(n_size):
+            best = -np.inf
+            best_k = 0
+            for k in range(n_size):
+                val = payoff[i, k] - c_adjust[j, k]
+                if val > best:
+                    best = val
+                    best_k = k
+            v_new[i, j] = best
+            n1_index[i, j] = best_k
+    return v_new, n1_index
+
+
+def _argmax_range(payoff, c_adjust, i, j, k_lo, k_hi, v_new, n1_index):
+    # max over n1 in [k_lo, k_hi] at (s, n0) = (i, j), written into v_new and n1_index
+    best = -np.inf
+    best_k = k_lo
+    for k in range(k_lo, k_hi + 1):
+        val = payoff[i, k] - c_adjust[j, k]
+        if val > best:
+            best = val
+            best_k = k
+    v_new[i, j] = best
+    n1_index[i, j] = best_k
+
+
+def _max_labor_choice_monotone(payoff, c_adjust):
+    """
+    The same as _max_labor_choice but exploits that the optimal n1 is nondecreasing in n0,
+    since the adjustment cost has increasing differences in (n1, n0).
+    For each s, the first and last n0 are searched over the full grid and the rest by divide and conquer,
+    searching n0 = mid only within the choices at its two neighbours already solved,
+    which costs O(N log N) instead of O(N^2).
+    """
+    s_size, n_size = payoff.shape
+    v_new = np.empty((s_size, n_size))
+    n1_index = np.empty((s_size, n_size), dtype=np.int64)
+    for i in range(s_size):
+        _argmax_range(payoff, c_adjust, i, 0, 0, n_size - 1, v_new, n1_index)
+        _argmax_range(payoff, c_adjust, i, n_size - 1, n1_index[i, 0], n_size - 1, v_new, n1_index)
+        stack = [(0, n_size - 1)]
+        while len(stack) > 0:
+            j_lo, j_hi = stack.pop()
+            if j_hi - j_lo <= 1:
+                continue
+            j = (j_lo + j_hi) // 2
+            _argmax_range(payoff, c_adjust, i, j, n1_index[i, j_lo], n1_index[i, j_hi], v_new, n1_index)
+            stack.append((j_lo, j))
+            stack.append((j, j_hi))
+    return v_new, n1_index
+
+
+def _push_forward(mu, n1_index, F):
+    # compiled loop of T_dist_operator: mu_new[:, n1] += mu[s, n0] * F[s, :]
+    s_size, n_size = mu.shape
+    mu_new = np.zeros_like(mu)
+    for i in range(s_size):
+        for j in range(n_size):
+            if mu[i, j] == 0:
+                continue
+            k = n1_index[i, j]
+            for i1 in range(s_size):
+                mu_new[i1, k] += mu[i, j] * F[i, i1]
+    return mu_new
+
+
+def dist_transition(n1_index, X, survival):
+    """
+    Sparse (S*N)x(S*N) matrix moving the surviving mass at (s, n0) to (s, n1), states in row-major order.
+    With the productivity transition this is one step of the distribution, i.e. T = (F.T kron I_N) @ G,
+        mu_new = F.T @ (G @ mu.ravel()).reshape(S, N)
+    which applies F.T by one dense matrix product instead of storing the S^2*N entries of T.
+    """
+    s_size, n_size = n1_index.shape
+    rows = np.repeat(np.arange(s_size), n_size) * n_size + n1_index.ravel()
+    cols = np.arange(s_size * n_size)
+    data = ((1 - X) * survival).ravel()
+    return sp.sparse.csr_array((data, (rows, cols)), shape=(s_size * n_size, s_size * n_size))
+
+
+if njit is not None:
+    _max_labor_choice = njit(cache=True)(_max_labor_choice)
+    _argmax_range = njit(cache=True)(_argmax_range)
+    _max_labor_choice_monotone = njit(cache=True)(_max_labor_choice_monotone)
+    _push_forward = njit(cache=True)(_push_forward)
+
+
 @dataclass
 class HR(Hopenhayn):
 
@@ -24,6 +125,9 @@ class HR(Hopenhayn):
     n_max: int = 5000
     tau_adj: float = 0
     labor_adj: str = "Firing"
+    backend: str = "numpy"  # numpy / numba, the latter runs compiled labor choice and distribution loops
+    labor_search: str = "full"  # full / monotone, the latter searches n1 using its monotonicity in n0
+    dist_solver: str = "sparse"  # sparse / loop, distribution iteration by dist_transition or T_dist_operator
 
     def __post_init__(self):
 
@@ -31,6 +135,14 @@ class HR(Hopenhayn):
         assert self.alt_timing == False, 'HR model is not applied to altnative timing right now.'
         assert self.vx == 0, 'HR model is not applied to changing exit value right now.'
         assert self.gamma_l == 0, 'HR model is not applied to wage distortion right now.'
+        assert self.v_solver == "vfi", 'HR model is not applied to howard or policy value solver right now.'
+        assert self.w_solver != "analytic_newton", 'HR model is not applied to analytic_newton wage solver right now.'
+        assert not self.sparse_F, 'HR model is not applied to sparse F right now.'
+        assert self.backend in ["numpy", "numba"], 'backend must be either numpy or numba.'
+        assert self.backend == "numpy" or njit is not None, 'numba backend requires numba to be installed.'
+        assert self.labor_search in ["full", "monotone"], 'labor search must be either full or monotone.'
+        assert self.labor_search == "full" or self.backend == "numba", 'monotone labor search requires numba backend.'
+        assert self.dist_solver in ["sparse", "loop"], 'distribution solver must be either sparse or loop.'
         assert self.labor_adj in ["Firing", "Full", "Hiring"
                                          ], 'Adjustment cost must be either Firing, Full, or Hiring.'
 
@@ -50,6 +162,8 @@ class HR(Hopenhayn):
         temp[:, 0] = self.nu
         self.nu = temp
 
+        self._set_payoff_grids()
+
     def adjustment_cost_func(self, n1, n0,):
         if self.labor_adj == "Firing":
             c_adjust = self.tau_adj * (n0 - n1).clip(min=0)
@@ -59,27 +173,66 @@ class HR(Hopenhayn):
             c_adjust = self.tau_adj * (n1 - n0).clip(min=0)
         return c_adjust
 
-    def T_value_operator(self, v, w):
-
+    def _set_payoff_grids(self):
+        # wage-independent pieces of the labor choice payoff, computed once per model
         s_grid, n_grid = self.s_grid, self.n_grid
+        # output of (s, n1), x=s, y=n1
+        self._f_vals = self.production_func(s_grid.reshape((-1, 1)), n_grid.reshape((1, -1)))
+        # adjustment cost of moving from n0 to n1, x=n0, y=n1
+        self._c_adjust = self.adjustment_cost_func(n_grid.reshape((1, -1)), n_grid.reshape((-1, 1)))
+        # adjustment cost paid on exit with n1
+        self._exit_cost = self.adjustment_cost_func(0, n_grid)
+
+        # wage-dependent profit and the 3-D payoff buffer, filled on use
+        self._pi_w = None
+        self._pi_vals = None
+        self._payoff = None
+
+    def _profit_vals(self, w):
+        # profit of (s, n1) before adjustment cost, x=s, y=n1, only updated when w changes
+        if self._pi_w != w:
+            p_temp = w if self.cf_in_labor else 1
+            self._pi_vals = self._f_vals - w * self.n_grid - p_temp * self.cf
+            self._pi_w = w
+        return self._pi_vals
 
-        # Note: 3-D matrix: x=s, y=n0, z=n1
+    def _labor_payoff(self, v, w):
+        # payoff of choosing n1 before adjustment cost, x=s, y=n1
+        integral = (self.F @ v) * (1 - self.delta)
+        return self._profit_vals(w) + self.beta * np.maximum(-self._exit_cost, integral)
 
-        f_vals = self.production_func(s_grid.reshape((-1, 1, 1)), n_grid.reshape((1, 1, -1)))
-        c_adjust_vals = self.adjustment_cost_func(n_grid.reshape((1, 1, -1)), n_grid.reshape((1, -1, 1)))
-        pi_vals = self.profit_func(f_vals, w, n_grid.reshape((1, 1, -1)), None, c_extra=c_adjust_vals)
+    def _solve_labor_choice_compiled(self, v, w):
+        max_labor_choice = _max_labor_choice_monotone if self.labor_search == "monotone" else _max_labor_choice
+        return max_labor_choice(self._labor_payoff(v, w), self._c_adjust)
 
+    def _labor_choice_payoff(self, v, w):
+        """
+        Payoff of every labor choice, in a 3-D matrix: x=s, y=n0, z=n1.
+        The matrix is written into one buffer reused across iterations.
+        """
+        if self._payoff is None:
+            self._payoff = np.empty((self.s_size, self.n_size, self.n_size))
+        payoff = self._payoff
 
-        exit_cost = self.adjustment_cost_func(0, n_grid.reshape((1, 1, -1)))
+        np.subtract(self._profit_vals(w)[:, np.newaxis, :], self._c_adjust[np.newaxis, :, :], out=payoff)
 
         integral = (self.F @ v)[:, np.newaxis, :]
         # for the case of exogenous exit, with no need to pay firing cost
         # otherwise need to + self.delta * exit_cost
         integral = integral * (1 - self.delta)
 
-        v1 = self.beta * np.maximum(-exit_cost, integral)
+        v1 = self.beta * np.maximum(-self._exit_cost, integral)
+
+        np.add(payoff, v1, out=payoff)
+        return payoff
+
+    def T_value_operator(self, v, w):
 
-        v_new = np.max(pi_vals + v1, axis=2)
+        if self.backend == "numba":
+            v_new, _ = self._solve_labor_choice_compiled(v, w)
+            return v_new
+
+        v_new = np.max(self._labor_choice_payoff(v, w), axis=2)
 
         # # old loop version
         # v_new = np.empty_like(v)
@@ -101,17 +254,11 @@ class HR(Hopenhayn):
     def solve_labor_decision(self, v, w):
         # the same as T_value_operator except last lines
 
-        s_grid, n_grid = self.s_grid, self.n_grid
-
-        f_vals = self.production_func(s_grid.reshape((-1, 1, 1)), n_grid.reshape((1, 1, -1)))
-        c_adjust_vals = self.adjustment_cost_func(n_grid.reshape((1, 1, -1)), n_grid.reshape((1, -1, 1)))
-        pi_vals = self.profit_func(f_vals, w, n_grid.reshape((1, 1, -1)), None, c_extra=c_adjust_vals)
+        if self.backend == "numba":
+            _, n1_index = self._solve_labor_choice_compiled(v, w)
+            return n1_index
 
-        integral = (self.F @ v)[:, np.newaxis, :] * (1 - self.delta)
-        exit_cost = self.adjustment_cost_func(0, n_grid.reshape((1, 1, -1)))
-        v1 = self.beta * np.maximum(-exit_cost, integral)
-
-        n1_index = np.argmax(pi_vals + v1, axis=2)
+        n1_index = np.argmax(self._labor_choice_payoff(v, w), axis=2)
 
         # n1_index = np.empty_like(v)
 
@@ -131,16 +278,22 @@ class HR(Hopenhayn):
         return n1_index
 
     def solve_exit_decision(self, v, w, n1_index):
-        X = np.empty_like(v)
 
-        s_grid, n_grid = self.s_grid, self.n_grid
+        s_grid = self.s_grid
 
-        for i in range(self.s_size):
-            for j in range(self.n_size):
-                n1_j = n1_index[i, j]
-                integral = v[:, n1_j] @ self.F[i, :]
-                exit_cost = self.adjustment_cost_func(0, n_grid[n1_j])
-                X[i, j] = int(-exit_cost > integral)
+        # expected value of each (s, n1) by one matrix product, then gathered at the chosen n1
+        integral = np.take_along_axis(self.F @ v, n1_index, axis=1)
+        exit_cost = self._exit_cost[n1_index]
+        X = (-exit_cost > integral).astype(v.dtype)
+
+        # # old loop version
+        # X = np.empty_like(v)
+        # for i in range(self.s_size):
+        #     for j in range(self.n_size):
+        #         n1_j = n1_index[i, j]
+        #         integral = v[:, n1_j] @ self.F[i, :]
+        #         exit_cost = self.adjustment_cost_func(0, n_grid[n1_j])
+        #         X[i, j] = int(-exit_cost > integral)
 
         x_index = np.argmin(X, axis=0)
         x = s_grid[x_index]
@@ -157,9 +310,12 @@ class HR(Hopenhayn):
         # delta for the case of exogenous exit
         mu = mu * ((1 - self.delta) / (1 + self.eta))
 
-        for i in range(self.s_size):
-            for j in range(self.n_size):
-                mu_new[:, n1_index[i, j]] += mu[i, j] * self.F[i, :]
+        if self.backend == "numba":
+            mu_new = _push_forward(mu, n1_index, self.F)
+        else:
+            for i in range(self.s_size):
+                for j in range(self.n_size):
+                    mu_new[:, n1_index[i, j]] += mu[i, j] * self.F[i, :]
 
         mu_new += m * self.nu
 
@@ -170,12 +326,19 @@ class HR(Hopenhayn):
         # Initialize mu
         mu = np.zeros_like(self.s_vals)
 
+        # the transition is fixed given the policy, so build it only once
+        if self.dist_solver == "sparse":
+            G = dist_transition(n1_index, X, (1 - self.delta) / (1 + self.eta))
+
         # Set up loop
         i = 0
         error = self.tol + 1
 
         while i < self.max_iter and error > self.tol:
-            mu_new = self.T_dist_operator(mu, n1_index, X, m)
+            if self.dist_solver == "sparse":
+                mu_new = self.F.T @ (G @ mu.ravel()).reshape(mu.shape) + m * self.nu
+            else:
+                mu_new = self.T_dist_operator(mu, n1_index, X, m)
             error = np.max(np.abs(mu - mu_new))
             i += 1
             if self.verbose and i % self.print_skip == 0:
@@ -218,14 +381,18 @@ class HR(Hopenhayn):
 
     def solve_m(self, w, n1_index, X, n_vals, f_vals):
         mu_m1 = self.dist_func_iteration(1, n1_index, X)
-        if self.m_solver == "newton":
-            m, res = sp.optimize.newton(self.labor_market_clearing, self.m_ini, args=(mu_m1, w, X, n_vals, f_vals),
-                                        maxiter=self.max_iter_, full_output=True)
-        elif self.m_solver == "brentq":
-            m, res = sp.optimize.brentq(self.labor_market_clearing, self.m_min, self.m_max,
-                                        args=(mu_m1, w, X, n_vals, f_vals),
-                                        maxiter=self.max_iter_, full_output=True)
-        assert res.converged, "Failed to converge entrant mass!"
+        args = (mu_m1, w, X, n_vals, f_vals)
+        # adjustment costs are also linear in mu, so the closed form applies as in Hopenhayn
+        m = self.solve_m_linear(args)
+        if m is None:
+            if self.m_solver == "newton":
+                m, res = sp.optimize.newton(self.labor_market_clearing, self.m_ini, args=args,
+                                            maxiter=self.max_iter_, full_output=True)
+            elif self.m_solver == "brentq":
+                m, res = sp.optimize.brentq(self.labor_market_clearing, self.m_min, self.m_max,
+                                            args=args,
+                                            maxiter=self.max_iter_, full_output=True)
+            assert res.converged, "Failed to converge entrant mass!"
 
         mu = m * mu_m1
         return m, mu
@@ -242,7 +409,7 @@ class HR(Hopenhayn):
 
         R = self.calculate_aggregate_adjustment_cost(mu, n_vals, X)
 
-        return Result_HR(
+        return self._share_grids(Result_HR(
             w=w,
             v=v,
             x=x,
@@ -265,6 +432,11 @@ class HR(Hopenhayn):
             nu=self.nu,
             ce=self.ce,
             cf=self.cf,
+            a=self.a,
+            rho=self.rho,
+            sigma=self.sigma,
+            G_mu=self.G_mu,
+            G_sigma=self.G_sigma,
             eta=self.eta,
             delta=self.delta,
             # not allowed para
@@ -280,7 +452,7 @@ class HR(Hopenhayn):
             # HR adj para
             tau_adj=self.tau_adj,
             labor_adj=self.labor_adj,
-        )
+        ))
 
 
 @dataclass
@@ -302,41 +474,29 @@ class Result_HR(Result):
         self.s_size = len(self.s_grid)
         self.n_size = len(self.n_grid)
 
-        super().__post_init__(inherit=True)
+    # statistics are lazy as in Result, overriding those that differ under adjustment costs
 
-        self.aggregate_profit = self.aggregate_profit - self.R
-        self.average_profit = self.aggregate_profit / self.aggregate_firm_mass
+    @cached_property
+    def _G(self):
+        # employment transition of the distribution, rebuilt from n1_index and X rather than stored
+        return dist_transition(self.n1_index, self.X, 1 - self.delta)
 
-        self.job_turnover_rate = ((np.sum(np.abs(self.n_vals*(1-self.X) - self.n_grid) * self.mu)
-                                   + np.sum(self.m*self.nu*self.n_vals))
-                                  / self.aggregate_employment_production)
+    @cached_property
+    def aggregate_profit(self):
+        return Result.aggregate_profit.func(self) - self.R
 
-        # gather statistics
-        self.stat = self._stat()
-        self.stat_size_dist = self._stat_size_dist()
+    @cached_property
+    def job_turnover_rate(self):
+        return ((np.sum(np.abs(self.n_vals*(1-self.X) - self.n_grid) * self.mu)
+                 + np.sum(self.m*self.nu*self.n_vals))
+                / self.aggregate_employment_production)
 
     def T_dist_operator(self, mu,):
-        # copy the function in model except remove eta part and remove last line of adding new entrant
-        mu_new = np.zeros_like(mu)
-        mu = (1 - self.X) * mu * (1 - self.delta)
-        for i in range(self.s_size):
-            for j in range(self.n_size):
-                mu_new[:, self.n1_index[i, j]] += mu[i, j] * self.F[i, :]
-        return mu_new
+        # the same transition in model except remove eta part and remove last line of adding new entrant
+        return self.F.T @ (self._G @ mu.ravel()).reshape(mu.shape)
 
-    def calculate_survival_stat(self, age=10):
-        conditional_pdf = self.nu
-        for _ in range(age-1):
-            nu_new = self.T_dist_operator(conditional_pdf)
-            conditional_pdf = nu_new
-        survival_rate = np.sum(conditional_pdf)
-        if self.cf_in_labor:
-            life_growth_rate = np.sum(
-                conditional_pdf / survival_rate * self.n_vals_plus_cf) / self.average_entrant_size_include_cf
-        else:
-            life_growth_rate = np.sum(conditional_pdf / survival_rate * self.n_vals) / self.average_entrant_size_prod
-        life_growth_rate = life_growth_rate - 1
-        return survival_rate*100, life_growth_rate*100
+    def _cohort_step(self, pdf):
+        return self.T_dist_operator(pdf)
 
     def _stat(self):
         df = self._stat_base()
@@ -345,56 +505,13 @@ class Result_HR(Result):
 
     def _stat_size_dist(self,):
         """
-        Calculate statistics for size distribution under sxn grids.
-        Use additional column loop otherwise the same as the original cope in hopenhayn.
+        Calculate statistics for size distribution under sxn grids, binning the 2-D grids in one pass.
+        As the original column loop, shares of all firms are reported in fractions and those of entrants in %.
         """
-
         n_threshold = [10, 30, 100, ]  # use 9,29,99?? // alternative: 5, 20, 50, 300
-
-        dist_num = np.zeros(len(n_threshold)+1)
-        dist_employ = np.zeros_like(dist_num)
-        for i in range(self.n_size):
-            n_at = self.n_vals[:, i].searchsorted(n_threshold)
-            dist_num += np.array([np.sum(g) for g in np.split(self.mu_pmf[:, i], n_at)])
-            dist_employ += np.array([np.sum(g) / self.aggregate_employment_production for g in np.split(
-                self.mu[:, i] * self.n_vals[:, i], n_at)])
-        n_at = self.n_vals[:, 0].searchsorted(n_threshold)
-        dist_num_entrant = [np.sum(g) * 100 for g in np.split(self.nu[:, 0], n_at)]
-        dist_employ_entrant = [np.sum(g) * 100 / self.aggregate_employment_production_entrant
-                               for g in np.split(self.m * self.nu[:, 0] * self.n_vals[:, 0], n_at)]
-
-        if self.cf_in_labor:
-            dist_num_include_cf = np.zeros_like(dist_num)
-            dist_employ_include_cf = np.zeros_like(dist_num)
-            for i in range(self.n_size):
-                n_at_include_cf = self.n_vals_plus_cf[:, i].searchsorted(n_threshold)
-                dist_num_include_cf += np.array([np.sum(g) for g in np.split(self.mu_pmf[:, i], n_at_include_cf)])
-                dist_employ_include_cf += np.array([np.sum(g) / self.aggregate_employment_include_cf
-                                                    for g in np.split(
-                                                    self.mu[:, i] * self.n_vals_plus_cf[:, i], n_at_include_cf)])
-            n_at_include_cf = (self.n_vals[:, 0] + self.cf).searchsorted(n_threshold)
-            dist_num_include_cf_entrant = [np.sum(g) * 100 for g in np.split(self.nu[:, 0], n_at_include_cf)]
-            dist_employ_include_cf_entrant = [
-                np.sum(g) * 100 / self.aggregate_employment_include_cf_entrant
-                for g in np.split(self.m * self.nu[:, 0] * self.n_vals_plus_cf[:, 0],
-                                  n_at_include_cf)]
-        else:
-            dist_num_include_cf = None
-            dist_employ_include_cf = None
-            dist_num_include_cf_entrant = None
-            dist_employ_include_cf_entrant = None
-
-        size_col = [str(a)+'-'+str(b) for a, b in zip(['']+n_threshold, n_threshold+[''])]
-        df = pd.DataFrame({
-            'num_prod': dist_num,
-            'emp_prod': dist_employ,
-            'num_prod_entrant': dist_num_entrant,
-            'emp_prod_entrant': dist_employ_entrant,
-            'num_include_cf': dist_num_include_cf,
-            'emp_include_cf': dist_employ_include_cf,
-            'num_include_cf_entrant': dist_num_include_cf_entrant,
-            'emp_include_cf_entrant': dist_employ_include_cf_entrant,
-        }, index=size_col).T
+        df = self.size_dist(n_threshold, sep="-")
+        incumbent_rows = ['num_prod', 'emp_prod'] + (['num_include_cf', 'emp_include_cf'] if self.cf_in_labor else [])
+        df.loc[incumbent_rows] = df.loc[incumbent_rows] / 100
         return df
 
 
@@ -88,6 +88,7 @@ def _solove_model_HR(x,
         n_max=5000,
         tau_adj=tau_adj,
         labor_adj=labor_adj,
+        backend="numba",
     )
     res = model.solve_model()
     return res
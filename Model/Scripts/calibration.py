@@ -3,18 +3,33 @@ This code calibrate the parameters to data moments
 """
 
 
+import os
+import json
+import time
+import multiprocessing
+from functools import partial
 import numpy as np
 import scipy as sp
 from datetime import datetime
 
 
-from hopenhayn import Hopenhayn
+import hopenhayn
+from hopenhayn import Hopenhayn, solve_batch
 from moments import Moments
+from result_cache import ResultCache, code_version
+from surrogate import surrogate_minimize
+from trace_log import TraceWriter, read_trace
 
 
 output_path_gs = "../Output/global_search/"
 output_path_ls = "../Output/local_search/"
 
+# names of the calibrated parameters in x, see _build_model
+param_names = ["ce", "cf", "G_mu", "G_sigma", "a", "rho", "sigma"]
+
+# solved economies shared across scripts, invalidated by any change of the model or calibration code
+result_cache = ResultCache(version=code_version(hopenhayn.__file__, __file__))
+
 
 class _data_moments:
     """
@@ -62,24 +77,27 @@ class _data_moments:
 
 
 def _model_moments(res, drop_moments=["growth_26"]):
+    # moments are evaluated only if not dropped, reading the lazy statistics of res directly
+    # size shares (rows: num, emp, entrant num, entrant emp) of the bin below 10, without the stat_size_dist table
+    share_1_9 = lambda row: res.size_shares([10])[row, 0] / 10
     model_moments = [
-            ("entry", res.stat.entry_rate),
-            ("avgsize", res.stat.average_firm_size_include_cf),
-            ("e_avgsize", res.stat.average_entrant_size_include_cf),
-            ("growth_10", res.calculate_survival_stat(age=10)[1]),
-            ("growth_20", res.calculate_survival_stat(age=20)[1]),
-            ("growth_26", res.calculate_survival_stat(age=26)[1]),
-            ("num_share_1_9", res.stat_size_dist.loc["num_include_cf", "~10"] / 10),
-            ("emp_share_1_9", res.stat_size_dist.loc["emp_include_cf", "~10"] / 10),
-            # ("emp_share_100_", res.stat_size_dist.loc["emp_include_cf", "100~"] / 10),
-            ("e_num_share_1_9", res.stat_size_dist.loc["num_include_cf_entrant", "~10"] / 10),
-            ("e_emp_share_1_9", res.stat_size_dist.loc["emp_include_cf_entrant", "~10"] / 10),
+            ("entry", lambda: res.entry_rate),
+            ("avgsize", lambda: res.average_firm_size_include_cf),
+            ("e_avgsize", lambda: res.average_entrant_size_include_cf),
+            ("growth_10", lambda: res.lifecycle_growth_rate_10_year),
+            ("growth_20", lambda: res.lifecycle_growth_rate_20_year),
+            ("growth_26", lambda: res.calculate_survival_stat(age=26)[1]),
+            ("num_share_1_9", lambda: share_1_9(0)),
+            ("emp_share_1_9", lambda: share_1_9(1)),
+            # ("emp_share_100_", lambda: res.size_shares([100])[1, 1] / 10),
+            ("e_num_share_1_9", lambda: share_1_9(2)),
+            ("e_emp_share_1_9", lambda: share_1_9(3)),
         ]
-    model_moments = np.array([m for n,m in model_moments if n not in drop_moments])
+    model_moments = np.array([m() for n,m in model_moments if n not in drop_moments])
     return model_moments
 
 
-def _solve_model(x, model_params=None
+def _build_model(x, model_params=None
                  ):
     ce, cf, G_mu, G_sigma, a, rho, sigma = x
     # ce, cf, G_mu, G_sigma, a, rho, sigma, delta = x  # @ calibrate additional delta
@@ -87,11 +105,14 @@ def _solve_model(x, model_params=None
 
     # Default parameters
     default_params = {
+        's_size': 240,
         'eta': 0.02, # setting the labor growth rate is somehow arbitrary
         'delta': 0, # if 0 no exogenous exit
-        # 'vx': 0, # exit value
+        'vx': 0, # exit value
         'tau_l': 1,
-        'gamma_l': 0
+        'gamma_l': 0,
+        'screen': True, # reject economies without equilibrium before the wage solve
+        'w_solver': "brentq",
     }
     if model_params is not None:
         default_params.update(model_params)
@@ -104,99 +125,418 @@ def _solve_model(x, model_params=None
         sigma=sigma,
         G_mu=G_mu,
         G_sigma=G_sigma,
-        s_size=240,
-        vx=0,
         A=0,
         **default_params,  # Unpack all model parameters
         equilibrium="BGP",
         cf_in_labor=1,
-        w_solver="brentq",
         m_solver="newton",
         suppress_fail=True,
     )
-    res = model.solve_model()
+    return model
+
+
+def _coarse_params(model_params, coarse_s_size):
+    # model params solving on the coarse grid only, by the solvers of Hopenhayn.solve_coarse
+    return {**(model_params or {}), "s_size": coarse_s_size, "w_solver": "analytic_newton", "v_solver": "policy"}
+
+
+def _solve_model(x, model_params=None, use_cache=True, **kwargs
+                 ):
+    """
+    kwargs are added to model_params, e.g. _solve_model(x, eta=0.00)
+    use_cache: if True, reuse the result of an identical economy from result_cache, or store the new one
+    """
+    model_params = {**(model_params or {}), **kwargs}
+    if not use_cache:
+        return _build_model(x, model_params).solve_model()
+
+    key = result_cache.key(x, model_params)
+    cached, res = result_cache.get(key)
+    if not cached:
+        res = _build_model(x, model_params).solve_model()
+        result_cache.put(key, res)
     return res
 
 
-def _target_moments(x, data_moments, res_file_path, model_params=None, drop_moments=None):
-    res = _solve_model(x, model_params)
-    if res == None:
+def _solve_model_batch(xs, model_params=None):
+    """
+    solve the economies of a population of parameter vectors (one per row of xs) in one batched pass
+    """
+    return solve_batch([_build_model(x, model_params) for x in xs])
+
+
+def _target_moments(x, data_moments, trace=None, model_params=None, drop_moments=None):
+    start = time.time()
+    res = _solve_model(x, model_params, use_cache=False)  # search points are rarely revisited
+    model_moments = None if res == None else _model_moments(res, drop_moments)
+    return _record(trace, x, model_moments, data_moments, time.time() - start)
+
+
+def _target_moments_batch(xs, data_moments, trace=None, model_params=None, drop_moments=None):
+    """
+    vectorized version of _target_moments: xs has shape (len(x), S) as passed by differential_evolution(vectorized=True)
+    """
+    xs = np.atleast_2d(xs.T)
+    start = time.time()
+    ress = _solve_model_batch(xs, model_params)
+    model_moments = [None if res == None else _model_moments(res, drop_moments) for res in ress]
+    solve_time = (time.time() - start) / len(xs)
+    diffs = np.array([_record(trace, x, m, data_moments, solve_time) for x, m in zip(xs, model_moments)])
+    if trace is not None:
+        trace.flush()
+    return diffs
+
+
+def _distance(model_moments, data_moments):
+    # return the objective and the normalized difference of each moment (None if the model fails)
+    if model_moments is None:
         # print(x, "Fail!")
-        return 1e7
-    model_moments = _model_moments(res, drop_moments)
+        return 1e7, None
     diff = model_moments - data_moments
     diff = diff / data_moments # normalize moment differences
-    diff = diff @ diff
-    # diff = np.sum(np.abs(diff)) # alternatively use linear sum of absolute diffs
-    # print(x, diff)
-    if res_file_path:
-        append_file(res_file_path, f"\n{','.join(map(str, x))},{diff}")
-    return diff
+    # return np.sum(np.abs(diff)), diff # alternatively use linear sum of absolute diffs
+    return diff @ diff, diff
 
 
-def append_file(file_path, message, ini=False):
-    if ini:
-        m = "w"
-    else:
-        m = "a"
-    with open(file_path, m) as file:
-        file.write(message)
+def _record(trace, x, model_moments, data_moments, solve_time=np.nan, kind="eval"):
+    # objective of an evaluation, recorded to the trace if any
+    objective, errors = _distance(model_moments, data_moments)
+    if trace is not None:
+        trace.record(x, objective, errors, solve_time, kind)
+    return objective
 
 
-def global_search_brute(data_moments, prange):
-    print(f"global search brute - prange: {prange}")
-    res_file_path = output_path_gs + "global_search_brute_" + datetime.now().strftime("%Y%m%d%H") + ".txt"
-    append_file(res_file_path, f"Para Grids: {prange}\nMoments: {data_moments.info_full}", ini=True)
+def _trace_writer(file_path, data_moments, size, info, append=False, batch_size=1000):
+    # trace of a search over parameter vectors of the given size, see TraceWriter;
+    # searches evaluating in this process one vector at a time pass batch_size=1 to write each row at once
+    names = param_names if size == len(param_names) else [f"x{i}" for i in range(size)]
+    moment_names = [name for name, _ in data_moments.moment_config]
+    return TraceWriter(file_path, names, moment_names, info=info, batch_size=batch_size, append=append)
+
+
+# state held by each worker of EvaluationPool, set once by _init_worker
+_worker_state = {}
+
+
+def _init_worker(model_params, drop_moments, coarse_s_size=None):
+    # with coarse_s_size, economies are solved on the coarse grid alone (coarse) or warm started from it (fine)
+    if coarse_s_size:
+        _worker_state["coarse_params"] = _coarse_params(model_params, coarse_s_size)
+        model_params = {**(model_params or {}), "coarse_s_size": coarse_s_size}
+    _worker_state["model_params"] = model_params
+    _worker_state["drop_moments"] = drop_moments
+
+
+def _worker_moments(x, coarse=False):
+    # model moments and solve time
+    start = time.time()
+    res = _solve_model(x, _worker_state["coarse_params" if coarse else "model_params"], use_cache=False)
+    model_moments = None if res is None else _model_moments(res, _worker_state["drop_moments"])
+    return model_moments, time.time() - start
+
+
+def _worker_moments_batch(xs, coarse=False):
+    start = time.time()
+    ress = _solve_model_batch(xs, _worker_state["coarse_params" if coarse else "model_params"])
+    model_moments = [None if res is None else _model_moments(res, _worker_state["drop_moments"]) for res in ress]
+    solve_time = (time.time() - start) / len(xs)
+    return [(m, solve_time) for m in model_moments]
+
+
+class EvaluationPool:
+    """
+    A process pool to evaluate the target moments of a population of parameter vectors.
+    Workers are initialized once with the model params and the moments to compute, then only parameter vectors
+    are sent to them and only model moments and solve times come back; distances and the trace are handled here.
+    workers
+        - number of processes, -1 for all cpus
+    chunksize
+        - parameter vectors sent to a worker at a time, if None about 4 chunks per worker
+    batch
+        - if True, each worker solves its chunk in one batched pass (hopenhayn.solve_batch)
+    start_method
+        - multiprocessing start method of the workers; "spawn" by default as forked workers of a process
+          that imported quantecon can hang the interpreter at exit
+    coarse_s_size
+        - if given, target_moments solves all vectors on a grid of coarse_s_size first, and only the fine_fraction
+          of them with the lowest coarse objective, and those failing on the coarse grid, again on the model grid,
+          warm started from the coarse solve (Hopenhayn.solve_coarse); the others keep their coarse objective,
+          traced with kind "coarse"
+    Use target_moments with differential_evolution(vectorized=True), and close the pool after use (or use with).
+    """
+
+    def __init__(self, data_moments, trace=None, model_params=None, drop_moments=None, workers=-1, chunksize=None, batch=False,
+                 start_method="spawn", coarse_s_size=None, fine_fraction=0.2):
+        self.data_moments = data_moments
+        self.trace = trace
+        self.workers = os.cpu_count() if workers == -1 else workers
+        self.chunksize = chunksize
+        self.batch = batch
+        self.coarse_s_size = coarse_s_size
+        self.fine_fraction = fine_fraction
+        self._pool = multiprocessing.get_context(start_method).Pool(self.workers, initializer=_init_worker,
+                                                                    initargs=(model_params, drop_moments, coarse_s_size))
+
+    def _chunksize(self, size):
+        if self.chunksize is not None:
+            return self.chunksize
+        return max(1, -(-size // (4 * self.workers)))
+
+    def model_moments(self, xs, coarse=False):
+        # model moments (None for failed solve) and solve time of each row of xs
+        xs = np.atleast_2d(xs)
+        chunksize = self._chunksize(len(xs))
+        if self.batch:
+            chunks = [xs[i:i+chunksize] for i in range(0, len(xs), chunksize)]
+            return [m for ms in self._pool.map(partial(_worker_moments_batch, coarse=coarse), chunks) for m in ms]
+        return self._pool.map(partial(_worker_moments, coarse=coarse), xs, chunksize=chunksize)
+
+    def evaluate(self, xs, coarse=False):
+        # objective of each row of xs, recorded to the trace
+        return np.array([_record(self.trace, x, m, self.data_moments, solve_time, "coarse" if coarse else "eval")
+                         for x, (m, solve_time) in zip(xs, self.model_moments(xs, coarse))])
+
+    def target_moments(self, xs):
+        """
+        vectorized target function: xs has shape (len(x), S) as passed by differential_evolution(vectorized=True)
+        """
+        xs = np.atleast_2d(xs.T)
+        if self.coarse_s_size:
+            diffs = self.evaluate(xs, coarse=True)
+            fine = np.argsort(diffs)[:int(np.ceil(self.fine_fraction * len(xs)))]
+            fine = np.union1d(fine, np.flatnonzero(diffs >= 1e7))  # a coarse failed solve may solve on the model grid
+            diffs[fine] = self.evaluate(xs[fine])
+        else:
+            diffs = self.evaluate(xs)
+        if self.trace is not None:
+            self.trace.flush()  # a generation at a time
+        return diffs
 
-    res = sp.optimize.brute(_target_moments, prange,
-                            args=(data_moments.moments, res_file_path),
-                            finish=None,
-                            workers=-1
-                            )
-    append_file(res_file_path, f"\n{','.join(map(str, res[0]))},{res[1]}")
+    def close(self):
+        self._pool.close()
+        self._pool.join()
 
+    def __enter__(self):
+        return self
 
-def global_search_diffevo(data_moments, prange, strategy="randtobest1bin", model_params=None,):
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DECheckpoint:
+    """
+    Checkpoint of differential_evolution, saved by callback at every generation:
+    population, population energies, state of the random generator and number of generations done.
+    The file is replaced atomically, so an interrupted search always leaves the last complete generation.
+    """
+
+    def __init__(self, file_path, rng, nit=0):
+        self.file_path = file_path
+        self.rng = rng
+        self.nit = nit
+
+    def callback(self, intermediate_result):
+        self.nit += 1
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f,
+                     population=intermediate_result.population,
+                     population_energies=intermediate_result.population_energies,
+                     rng_state=json.dumps(self.rng.bit_generator.state),
+                     nit=self.nit,
+                     )
+        os.replace(temp_path, self.file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        # return the checkpoint with its random generator restored, the population and the energies
+        with np.load(file_path) as data:
+            population, energies = data["population"], data["population_energies"]
+            state, nit = json.loads(data["rng_state"].item()), data["nit"].item()
+        rng = np.random.default_rng()
+        rng.bit_generator.state = state
+        return cls(file_path, rng, nit), population, energies
+
+
+class _ResumedObjective:
+    """
+    Objective of a resumed differential_evolution, which returns the checkpointed energies for the checkpointed
+    population (the initial population when resuming) instead of solving these economies again.
+    """
+
+    def __init__(self, func, population, energies, vectorized):
+        self.func = func
+        self.population = population
+        self.energies = energies
+        self.vectorized = vectorized
+
+    def _lookup(self, xs):
+        # energies of the rows of xs if all of them are in the checkpointed population, else None
+        energies = []
+        for x in xs:
+            match = np.flatnonzero(np.all(np.isclose(self.population, x, rtol=1e-12, atol=0), axis=1))
+            if len(match) == 0:
+                return None
+            energies.append(self.energies[match[0]])
+        return np.array(energies)
+
+    def __call__(self, x, *args):
+        energies = self._lookup(x.T if self.vectorized else [x])
+        if energies is None:
+            return self.func(x, *args)
+        return energies if self.vectorized else energies[0]
+
+
+def global_search_brute(data_moments, prange):
+    print(f"global search brute - prange: {prange}")
+    trace_path = output_path_gs + "global_search_brute_" + datetime.now().strftime("%Y%m%d%H") + ".csv"
+    with _trace_writer(trace_path, data_moments, len(prange),
+                       info=[f"Para Grids: {prange}", f"Moments: {data_moments.info_full}"]) as trace:
+        res = sp.optimize.brute(_target_moments, prange,
+                                args=(data_moments.moments, trace, None, data_moments.drop_moments),
+                                finish=None,
+                                workers=-1
+                                )
+        trace.record(res[0], res[1], kind="result")
+
+
+def global_search_diffevo(data_moments, prange, strategy="randtobest1bin", model_params=None, vectorized=False,
+                          engine="pool", workers=-1, chunksize=None, maxiter=1000, seed=None, resume=None,
+                          coarse_s_size=None, fine_fraction=0.2,):
+    """
+    vectorized: if True, solve economies in batched passes (hopenhayn.solve_batch)
+    engine
+        - "pool": evaluate each generation by EvaluationPool, with workers initialized once
+        - "scipy": let differential_evolution map _target_moments over its own workers
+    coarse_s_size, fine_fraction
+        - multi-resolution search under engine "pool": each generation is solved on a grid of coarse_s_size, and
+          only its fine_fraction best candidates and its coarse failures on the model grid (see EvaluationPool);
+          the result is solved on the model grid
+    resume
+        - start_time of an interrupted search to resume from its last checkpoint (see DECheckpoint),
+          continuing its trace without solving the checkpointed population again
+    Evaluations are traced to a csv file in output_path_gs, see TraceWriter.
+    """
+    assert engine in ["pool", "scipy"], f"engine {engine} is not supported."
+    assert engine == "pool" or not coarse_s_size, "multi-resolution search runs on engine pool only."
     print(f"global search diffevo - prange: {prange}")
-    start_time =  datetime.now().strftime("%Y%m%d%H")
-    res_file_path = output_path_gs + "global_search_diffevo_" + start_time + ".txt"
-    append_file(res_file_path, f"Para Grids: {prange}\nMoments: {data_moments.info_full}", ini=True)
-    append_file(res_file_path, f"Additional model_params: {model_params}")
-
-    res = sp.optimize.differential_evolution(_target_moments, prange,
-                                             args=(data_moments.moments, res_file_path, model_params, data_moments.drop_moments),
-                                             polish=False,
-                                             strategy=strategy,
-                                             #   disp=True,
-                                             updating="deferred",
-                                             workers=-1,
-                                             )
-    append_file(res_file_path, f"\n{','.join(map(str, res.x))},{res.fun}")
+    start_time = resume if resume else datetime.now().strftime("%Y%m%d%H")
+    file_path = output_path_gs + "global_search_diffevo_" + start_time
+    with _trace_writer(file_path + ".csv", data_moments, len(prange),
+                       info=[f"Para Grids: {prange}", f"Moments: {data_moments.info_full}",
+                             f"Additional model_params: {model_params}"],
+                       append=resume is not None, batch_size=1 if engine == "scipy" else 1000) as trace:
+        de_params = dict(polish=False, strategy=strategy, updating="deferred")  # disp=True
+        if resume:
+            checkpoint, population, energies = DECheckpoint.load(file_path + ".checkpoint.npz")
+            print(f"  resume from generation {checkpoint.nit}")
+            de_params.update(init=population)
+        else:
+            checkpoint = DECheckpoint(file_path + ".checkpoint.npz", np.random.default_rng(seed))
+        de_params.update(maxiter=max(maxiter - checkpoint.nit, 0), rng=checkpoint.rng, callback=checkpoint.callback)
+
+        def objective(func, is_vectorized):
+            return _ResumedObjective(func, population, energies, is_vectorized) if resume else func
+
+        args = (data_moments.moments, trace, model_params, data_moments.drop_moments)
+        if engine == "pool":
+            with EvaluationPool(data_moments.moments, trace, model_params, data_moments.drop_moments,
+                                workers=workers, chunksize=chunksize, batch=vectorized,
+                                coarse_s_size=coarse_s_size, fine_fraction=fine_fraction) as pool:
+                res = sp.optimize.differential_evolution(objective(pool.target_moments, True), prange,
+                                                         vectorized=True, **de_params)
+                if coarse_s_size:  # the best energy may be a coarse one
+                    res.fun = pool.evaluate(res.x[np.newaxis])[0]
+        elif vectorized:
+            res = sp.optimize.differential_evolution(objective(_target_moments_batch, True), prange, args=args,
+                                                     vectorized=True, **de_params)
+        else:
+            res = sp.optimize.differential_evolution(objective(_target_moments, False), prange, args=args,
+                                                     workers=workers, **de_params)
+        trace.record(res.x, res.fun, kind="result")
+    return res.x, start_time
+
+
+def _trace_evaluations(names, prange):
+    # parameter vectors inside prange and their objectives, evaluated in the global search traces names
+    xs, ys = [np.empty((0, len(prange)))], [np.empty(0)]
+    lb, ub = np.array(prange).T
+    for name in names:
+        df = read_trace(output_path_gs + name + ".csv")
+        df = df[df["kind"] == "eval"]
+        x = df[[c for c in df.columns if c.startswith("param_")]].to_numpy(dtype=float)
+        if x.shape[1] != len(prange):
+            continue
+        inside = np.all((x >= lb) & (x <= ub), axis=1)
+        xs.append(x[inside])
+        ys.append(df["objective"].to_numpy(dtype=float)[inside])
+    return np.vstack(xs), np.concatenate(ys)
+
+
+def global_search_surrogate(data_moments, prange, model_params=None, traces=(), n_init=None, maxfev=500, batch=None,
+                            workers=-1, vectorized=False, seed=None, max_points=300,):
+    """
+    Bayesian optimization: the model is solved only at the points proposed by a Gaussian process surrogate of the
+    objective, see surrogate.surrogate_minimize
+    traces
+        - names of earlier global search traces (e.g. "global_search_diffevo_2024112108") to the same data moments
+          and model params, whose evaluations inside prange start the surrogate
+    maxfev
+        - model solves of this search
+    batch
+        - points proposed per round and solved in parallel by EvaluationPool, by default one per worker
+    max_points
+        - points the surrogate is fitted on: the best of all evaluations and a space-filling subsample of the rest
+    Evaluations are traced to a csv file in output_path_gs, see TraceWriter.
+    """
+    print(f"global search surrogate - prange: {prange}")
+    start_time = datetime.now().strftime("%Y%m%d%H")
+    xs, ys = _trace_evaluations(traces, prange)
+    with _trace_writer(output_path_gs + "global_search_surrogate_" + start_time + ".csv", data_moments, len(prange),
+                       info=[f"Para Grids: {prange}", f"Moments: {data_moments.info_full}",
+                             f"Additional model_params: {model_params}", f"Start traces: {list(traces)}"]) as trace:
+        with EvaluationPool(data_moments.moments, trace, model_params, data_moments.drop_moments,
+                            workers=workers, batch=vectorized) as pool:
+            res = surrogate_minimize(pool.target_moments, prange, xs=xs, ys=ys, n_init=n_init, maxfev=maxfev,
+                                     batch=batch if batch else pool.workers, rng=seed, max_points=max_points)
+        trace.record(res.x, res.fun, kind="result")
     return res.x, start_time
 
 
 def local_search(x0, data_moments, prange=None, method="L-BFGS-B", maxiter=1e4, output_time=None, model_params=None,):
     print(f"local search - \n  method: {method} \n  Bound: {prange} \n  x0: {x0}")
     output_name = "local_search_" + output_time if output_time else "local_search_" + datetime.now().strftime("%Y%m%d%H")
-    res_file_path = output_path_ls + output_name + ".txt"
-    append_file(res_file_path, f"Moments: {data_moments.info}\nMethod: {method} Bound: {prange}\nx0: {x0}", ini=True)
-    res = sp.optimize.minimize(
-        _target_moments,
-        x0=x0,
-        args=(data_moments.moments, None, model_params, data_moments.drop_moments),
-        tol=1e-5,
-        # method=method,  # "Powell"
-        bounds=prange,
-        # options={"maxiter": maxiter},
-    )
-    if res.success:
-        append_file(res_file_path, f"\n{','.join(map(str, res.x))},{res.fun}")
-    else:
-        print("Failed to converge locally!")
-        append_file(res_file_path, "Failed to converge locally! Use the global search result!")
-        append_file(res_file_path, f"\n{','.join(map(str, x0))},{_target_moments(x0, data_moments.moments, False)}")
+    trace_path = output_path_ls + output_name + ".csv"
+    with _trace_writer(trace_path, data_moments, len(x0),
+                       info=[f"Moments: {data_moments.info}", f"Method: {method} Bound: {prange}", f"x0: {list(x0)}"],
+                       batch_size=1) as trace:
+        args = (data_moments.moments, trace, model_params, data_moments.drop_moments)
+        res = sp.optimize.minimize(
+            _target_moments,
+            x0=x0,
+            args=args,
+            tol=1e-5,
+            # method=method,  # "Powell"
+            bounds=prange,
+            # options={"maxiter": maxiter},
+        )
+        if res.success:
+            trace.record(res.x, res.fun, kind="result")
+        else:
+            print("Failed to converge locally!")
+            # use the global search result
+            trace.record(x0, _target_moments(x0, data_moments.moments, None, model_params, data_moments.drop_moments),
+                         kind="result_global")
 
 def read_result(path=output_path_ls, name="benchmark", line=-1):
+    """
+    Return the parameters and objective at a row of a search trace, by default the last row, i.e. the search result.
+    Read the trace name.csv if it exists, otherwise the text result file name.txt of older searches.
+    """
+    if os.path.exists(path+name+".csv"):
+        df = read_trace(path+name+".csv")
+        row = df.iloc[line]
+        return [float(row[c]) for c in df.columns if c.startswith("param_")] + [float(row["objective"])]
     with open(path+name+".txt") as f:
         last_line = f.readlines()[line]
     res = list(map(float, last_line.split(",")))
@@ -215,6 +555,8 @@ def main():
     # prange = ((1, 120), (0.5, 5), (-.1, 2.5), (0.1, 0.8), (-0.2, 0.2), (0.92, 0.98), (0.1, 0.4), (0, 0.2))  # @ calibrate additional gamma
 
     x0, start_time = global_search_diffevo(data_moments, prange, strategy="randtobest1bin")
+    # # alternatively, surrogate search with far fewer model solves, starting from the evaluations of earlier searches
+    # x0, start_time = global_search_surrogate(data_moments, prange, traces=["global_search_diffevo_2024112108"])
     # use global search result to do local search
     local_search(x0=x0, data_moments=data_moments, prange=prange, output_time=start_time)
     # # for separate global search and local search
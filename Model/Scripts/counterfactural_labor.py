@@ -7,12 +7,13 @@ import pandas as pd
 import math
 
 from moments import Moments
+from hopenhayn import scale_rows
 from calibration import read_result, _solve_model
 
 
 def _solve_evolution(mu_t0, L_s, res):
 
-    P_x = (res.F * (1 - res.X).reshape(len(res.X), 1)).T
+    P_x = scale_rows(res.F, 1 - res.X).T
     mu_t1_incumbent = P_x @ mu_t0
 
     L_d_t1_incumbent = mu_t1_incumbent @ res.n_vals_plus_cf
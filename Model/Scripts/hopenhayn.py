@@ -3,7 +3,9 @@ This code solves the industry equilibrium given calibrated parameters
 """
 
 
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from functools import cached_property, lru_cache
 from typing import Any
 
 import numpy as np
@@ -19,6 +21,79 @@ import matplotlib.pyplot as plt
 Array = Any
 
 
+def scale_rows(F, d):
+    # diag(d) @ F, keeping F dense or sparse
+    if sp.sparse.issparse(F):
+        return sp.sparse.diags_array(np.asarray(d, dtype=float)) @ F
+    return F * d.reshape(-1, 1)
+
+
+def eye_like(F):
+    # identity matrix in the same format as F
+    if sp.sparse.issparse(F):
+        return sp.sparse.eye_array(F.shape[0], format="csc")
+    return np.eye(F.shape[0])
+
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+
+
+@lru_cache(maxsize=32)
+def tauchen_grid(a, rho, sigma, s_size):
+    """
+    Tauchen approximation of log productivity, cached as it depends only on (a, rho, sigma, s_size).
+    The arrays are shared by all models with these parameters, so they are read-only.
+    """
+    # https://quanteconpy.readthedocs.io/en/latest/markov/approximation.html#quantecon.markov.approximation.tauchen
+    mc = markov.tauchen(
+        rho=rho, sigma=sigma, mu=a, n_std=4, n=s_size
+    )
+    s_vals = np.exp(mc.state_values)
+    _read_only(mc.P, mc.state_values, s_vals)
+    return mc, s_vals
+
+
+@lru_cache(maxsize=32)
+def entrant_grid(G_mu, G_sigma, a, rho, sigma, s_size):
+    # get pmf of state grids for entrants, cached as tauchen_grid
+    # Problem: if the grid from tauchen is too sparse for entry cohort,
+    # most entrants would likely to have the same value?
+    _, s_vals = tauchen_grid(a, rho, sigma, s_size)
+    G = lognorm(s=G_sigma, scale=np.e**(G_mu))
+    pdf_entry = G.pdf(s_vals)
+    nu = pdf_entry / np.sum(pdf_entry)  # not sure correct, or use cdf?
+    _read_only(nu)
+    return nu
+
+
+def size_cumsums(size, weights):
+    """
+    Sorted sizes of the (flattened) grid and cumulative sums of each array in weights in that order,
+    so that the sums over any size bins are differences of the cumulative sums, see bin_sums.
+    """
+    size = np.ravel(size)
+    order = np.argsort(size, kind="stable")
+    cumsums = np.zeros((len(weights), size.size + 1))
+    for i, w in enumerate(weights):
+        np.cumsum(np.ravel(w)[order], out=cumsums[i, 1:])
+    return size[order], cumsums
+
+
+def bin_sums(sorted_size, cumsums, thresholds):
+    # sums of the weights over the size bins (-inf, t_0), [t_0, t_1), ..., [t_last, inf) of increasing thresholds
+    at = np.concatenate([[0], np.searchsorted(sorted_size, thresholds), [sorted_size.size]])
+    return np.diff(cumsums[:, at], axis=1)
+
+
+def shared_grids(a, rho, sigma, G_mu, G_sigma, s_size):
+    # the cached primitive grids of a model, see tauchen_grid and entrant_grid
+    mc, s_vals = tauchen_grid(a, rho, sigma, s_size)
+    nu = entrant_grid(G_mu, G_sigma, a, rho, sigma, s_size)
+    return {"F": mc.P, "s_vals": s_vals, "nu": nu}
+
+
 @dataclass
 class Hopenhayn:
     """
@@ -66,8 +141,19 @@ class Hopenhayn:
     gamma_l: float = 0  # distortion parameter for labor wage tax
 
     # iteration parameters
+    v_solver: str = "vfi"  # vfi / howard / policy
+    howard_steps: int = 50  # policy evaluation sweeps per improvement step if howard
+    warm_start: bool = True  # start value iteration from the converged v at the nearest solved wage
+    warm_start_size: int = 8  # number of converged (w, v) kept for warm start
+    screen: bool = False  # if True, reject economies without equilibrium in [w_min, w_max] by value bounds before the wage solve
+    screen_steps: int = 5  # T_value_operator steps tightening the value bounds, see value_bounds
+    coarse_s_size: int = 0  # if > 0, solve first on a grid of coarse_s_size to warm start the wage solve, see solve_coarse
+    coarse_bracket: float = 0.02  # relative width of the first wage bracket around the coarse wage under brentq
     w_solver: str = "brentq"
     m_solver: str = "newton"
+    mu_solver: str = "lu"  # lu / sparse, factorization used in solve_mu
+    sparse_F: bool = False  # if True, store F as a truncated sparse matrix
+    sparse_tol: float = 1e-12  # transition probabilities below are dropped under sparse_F or sparse mu_solver
     w_ini: float = 1
     w_min: float = 0.1
     w_max: float = 10
@@ -84,8 +170,11 @@ class Hopenhayn:
     def __post_init__(self):
 
         assert self.cf_in_labor in [0, 1], 'cf_in_labor must be either 1 (labor) or 0 (product).'
-        assert self.w_solver in ['newton', 'brentq'], 'optimal solver must be either newton or brentq.'
+        assert self.v_solver in ['vfi', 'howard', 'policy'], 'value solver must be either vfi, howard or policy.'
+        assert self.w_solver in ['newton', 'brentq', 'analytic_newton'
+                                 ], 'optimal solver must be either newton, brentq or analytic_newton.'
         assert self.m_solver in ['newton', 'brentq'], 'optimal solver must be either newton or brentq.'
+        assert self.mu_solver in ['lu', 'sparse'], 'distribution solver must be either lu or sparse.'
         assert self.equilibrium in ['PE', 'GE', 'BGP'], 'equilibrium must be either PE, GE or BGP.'
         if self.equilibrium == 'GE':
             assert self.A > 0, 'under GE, A must be greater than 0.'
@@ -95,25 +184,33 @@ class Hopenhayn:
             assert self.eta >= 0, 'under BGP, population growth eta must be greater than 0.'
             assert self.A == 0, 'under BGP, A in utility function has no effect. Please set A to 0.'
 
-        # create state grids from tauchen approximation
-        # https://quanteconpy.readthedocs.io/en/latest/markov/approximation.html#quantecon.markov.approximation.tauchen
-        self.mc = markov.tauchen(
-            rho=self.rho, sigma=self.sigma, mu=self.a, n_std=4, n=self.s_size
-        )
-        self.s_vals = np.exp(self.mc.state_values)
+        # create state grids from tauchen approximation, shared with models of the same grid parameters
+        self.mc, self.s_vals = tauchen_grid(self.a, self.rho, self.sigma, self.s_size)
         # conditional probabilities
         self.F = self.mc.P
+        if self.sparse_F:
+            self.F = self._truncate_transition(self.F)
 
         self.nu = self._set_entrant_grid()
+        # the shared grids this model was built from, see _share_grids
+        self._grids = {"F": self.mc.P, "s_vals": self.s_vals, "nu": self.nu}
+
+        # converged value functions of recent wage trials, see value_func_iteration
+        self._v_history = deque(maxlen=self.warm_start_size)
+        # value interpolated from the coarse grid, see solve_coarse
+        self._v_coarse = None
+        # factorization of the last distribution system, see solve_mu
+        self._mu_factor = (None, None)
+
+    def _truncate_transition(self, P):
+        # drop probabilities below sparse_tol and renormalize each row to sum to one
+        P = np.where(P < self.sparse_tol, 0, P)
+        P = P / P.sum(axis=1, keepdims=True)
+        return sp.sparse.csr_array(P)
 
     def _set_entrant_grid(self):
-        # get pmf of state grids for entrants
-        # Problem: if the grid from tauchen is too sparse for entry cohort,
-        # most entrants would likely to have the same value?
-        G = lognorm(s=self.G_sigma, scale=np.e**(self.G_mu))
-        pdf_entry = G.pdf(self.s_vals)
-        nu = pdf_entry / np.sum(pdf_entry)  # not sure correct, or use cdf?
-        return nu
+        # get pmf of state grids for entrants, see entrant_grid
+        return entrant_grid(self.G_mu, self.G_sigma, self.a, self.rho, self.sigma, self.s_size)
 
     def solve_employment(self, s, w):
         if self.gamma_l != 0:
@@ -155,18 +252,129 @@ class Hopenhayn:
 
         return v_new
 
+    def solve_stay_decision(self, v, w):
+        """
+        Return the continuation choice (True if stay) that T_value_operator picks given v.
+        """
+        integral = (self.F @ v) * (1 - self.delta) + self.delta * self.vx
+
+        if self.alt_timing:
+            n_vals = self.solve_employment(self.s_vals, w)
+            f_vals = self.production_func(self.s_vals, n_vals)
+            pi_vals = self.profit_func(f_vals, w, n_vals, self.s_vals)
+            return pi_vals + self.beta * integral >= self.vx
+
+        return integral >= self.vx
+
+    def T_policy_operator(self, v, w, stay):
+        # the same as T_value_operator but with the continuation choice fixed
+        integral = (self.F @ v) * (1 - self.delta) + self.delta * self.vx
+
+        n_vals = self.solve_employment(self.s_vals, w)
+        f_vals = self.production_func(self.s_vals, n_vals)
+        pi_vals = self.profit_func(f_vals, w, n_vals, self.s_vals)
+
+        if self.alt_timing:
+            return np.where(stay, pi_vals + self.beta * integral, self.vx)
+        return pi_vals + self.beta * np.where(stay, integral, self.vx)
+
+    def policy_evaluation(self, w, stay):
+        """
+        Solve the value under a fixed continuation choice from the linear system
+            (I - beta * (1 - delta) * diag(stay) @ F) @ v = b
+        """
+        stay = stay.astype(float)
+
+        n_vals = self.solve_employment(self.s_vals, w)
+        f_vals = self.production_func(self.s_vals, n_vals)
+        pi_vals = self.profit_func(f_vals, w, n_vals, self.s_vals)
+
+        if self.alt_timing:
+            b = stay * (pi_vals + self.beta * self.delta * self.vx) + (1 - stay) * self.vx
+        else:
+            b = pi_vals + self.beta * (stay * self.delta + (1 - stay)) * self.vx
+
+        return self._factorize(self._policy_matrix(stay))(b)
+
+    def _policy_matrix(self, stay):
+        P_stay = scale_rows(self.F, stay)
+        return eye_like(self.F) - self.beta * (1 - self.delta) * P_stay
+
+    def value_derivative_wage(self, v, w):
+        """
+        Derivative of v with respect to w by the envelope theorem,
+        i.e. holding employment and the continuation choice implied by v fixed:
+            (I - beta * (1 - delta) * diag(stay) @ F) @ dv = dpi
+        where dpi = - (n + cf) * w / w_nominal (cf only if paid in labor)
+        """
+        stay = self.solve_stay_decision(v, w).astype(float)
+
+        n_vals = self.solve_employment(self.s_vals, w)
+        w_unit = self.tau_l * (self.s_vals**self.gamma_l) if self.gamma_l != 0 else 1
+        dpi_vals = - w_unit * (n_vals + self.cf_in_labor * self.cf)
+
+        if self.alt_timing:
+            dpi_vals = stay * dpi_vals
+
+        return self._factorize(self._policy_matrix(stay))(dpi_vals)
+
+    def _initial_value(self, w):
+        """
+        Return (v, exact) to start value iteration at w, where exact is True if w has been solved.
+        With warm_start, v is interpolated linearly between the nearest solved wages on either side
+        of w, or taken from the nearest solved wage if w is not bracketed; otherwise v is the value
+        from the coarse grid if solved (see solve_coarse), or ones.
+        """
+        if not self.warm_start or len(self._v_history) == 0:
+            if self._v_coarse is not None:
+                return self._v_coarse.copy(), False
+            return np.ones_like(self.s_vals), False
+
+        lower = [wv for wv in self._v_history if wv[0] <= w]
+        upper = [wv for wv in self._v_history if wv[0] >= w]
+        if lower and upper:
+            w_lo, v_lo = max(lower, key=lambda wv: wv[0])
+            w_hi, v_hi = min(upper, key=lambda wv: wv[0])
+            if w_lo == w_hi:
+                return v_lo.copy(), True
+            weight = (w - w_lo) / (w_hi - w_lo)
+            return (1 - weight) * v_lo + weight * v_hi, False
+
+        w_near, v_near = min(self._v_history, key=lambda wv: abs(wv[0] - w))
+        return v_near.copy(), False
+
     def value_func_iteration(self, w):
+        """
+        Note:
+          - vfi: successive approximation with T_value_operator
+          - howard: each improvement step is followed by howard_steps sweeps of T_policy_operator
+          - policy: each improvement step solves the value of the policy exactly,
+            so the loop stops once the continuation choice no longer changes
+          - if warm_start, iteration starts from the values at the nearest wages solved before,
+            and a wage solved before returns its value directly
+        """
 
         # Initialize v
-        v = np.ones_like(self.s_vals)
+        v, exact = self._initial_value(w)
+        if exact:
+            return v
 
         # Set up loop
         i = 0
         error = self.tol + 1
 
         while i < self.max_iter and error > self.tol:
-            v_new = self.T_value_operator(v, w)
-            error = np.max(np.abs(v - v_new))
+            if self.v_solver == "policy":
+                stay = self.solve_stay_decision(v, w)
+                v_new = self.policy_evaluation(w, stay)
+                error = np.max(np.abs(v - v_new))
+            else:
+                v_new = self.T_value_operator(v, w)
+                error = np.max(np.abs(v - v_new))
+                if self.v_solver == "howard" and error > self.tol:
+                    stay = self.solve_stay_decision(v, w)
+                    for _ in range(self.howard_steps):
+                        v_new = self.T_policy_operator(v_new, w, stay)
             i += 1
             if self.verbose and i % self.print_skip == 0:
                 print(f"Error at iteration {i} is {error}.")
@@ -178,6 +386,9 @@ class Hopenhayn:
         if self.verbose and i < self.max_iter:
             print(f"Value converged in {i} iterations.")
 
+        if self.warm_start and error <= self.tol:
+            self._v_history.append((w, v))
+
         return v  # , error, i
 
     def entry_clearing(self, w,):
@@ -186,13 +397,158 @@ class Hopenhayn:
         error = v_entry - self.ce   # self.ce * w if ce unit in labor // no need - self.vx
         return error
 
-    def solve_wage(self,):
+    def entry_clearing_prime(self, w,):
+        # entry_clearing together with its analytic derivative in w
+        v = self.value_func_iteration(w)
+        dv = self.value_derivative_wage(v, w)
+        error = np.sum(v * self.nu) - self.ce
+        d_error = np.sum(dv * self.nu)
+        return error, d_error
+
+    def analytic_newton_wage(self, w_ini=None):
+        """
+        Newton iteration on entry_clearing_prime safeguarded by the bracket [w_min, w_max].
+        Since the entry value is decreasing in w, the sign of each trial updates the bracket,
+        and a Newton step leaving the bracket is replaced by bisection.
+        w_ini: starting wage, self.w_ini if None
+        """
+        w_lo, w_hi = self.w_min, self.w_max
+        w = min(max(self.w_ini if w_ini is None else w_ini, w_lo), w_hi)
+
+        for i in range(self.max_iter_):
+            error, d_error = self.entry_clearing_prime(w)
+            if error == 0:
+                return w
+            if error > 0:
+                w_lo = w
+            else:
+                w_hi = w
+
+            # converge only on a Newton step inside the bracket, so that bisection towards
+            # an end of [w_min, w_max] without root is reported as failure rather than convergence
+            w_new = w - error / d_error if d_error < 0 else np.nan
+            if w_lo < w_new < w_hi:
+                if abs(w_new - w) <= self.tol * (1 + abs(w)):
+                    return w_new
+            else:
+                if w_hi - w_lo <= self.tol * (1 + abs(w)):
+                    raise ValueError(f"No root of entry clearing in [{self.w_min}, {self.w_max}].")
+                w_new = (w_lo + w_hi) / 2
+            w = w_new
+
+        raise RuntimeError("Failed to converge price!")
+
+    def value_bounds(self, w, stay_solve=None):
+        """
+        Return lower and upper bounds of v at w without value iteration.
+        The values of never exiting (one linear solve) and of exiting next period bound v from below;
+        the value of never exiting plus the largest loss that exiting avoids bounds it from above,
+        as T_value_operator does not raise it. screen_steps steps of T_value_operator then tighten both,
+        since the operator is monotone with fixed point v.
+        stay_solve: solver of (I - beta * (1 - delta) * F), the same for all w
+        """
+        if stay_solve is None:
+            stay_solve = self._factorize(self._policy_matrix(np.ones_like(self.s_vals)))
+        n_vals = self.solve_employment(self.s_vals, w)
+        f_vals = self.production_func(self.s_vals, n_vals)
+        pi_vals = self.profit_func(f_vals, w, n_vals, self.s_vals)
+
+        v_stay = stay_solve(pi_vals + self.beta * self.delta * self.vx)
+        v_lo = np.maximum(v_stay, pi_vals + self.beta * self.vx)
+        v_hi = v_stay + self.beta * (1 - self.delta) * max(np.max(self.vx - self.F @ v_stay), 0)
+        for _ in range(self.screen_steps):
+            v_lo, v_hi = self.T_value_operator(v_lo, w), self.T_value_operator(v_hi, w)
+        return v_lo, v_hi
+
+    def screen_feasibility(self, bisect_steps=8):
+        """
+        Return why the model has no equilibrium, or None if it may have one, judged by value_bounds only.
+        Since the entry value is decreasing in w, entry clearing has no root in [w_min, w_max] if its lower bound
+        at w_max is positive or its upper bound at w_min negative. Otherwise the wage is below any w where the
+        upper bound is negative (found by bisect_steps bisections), and no firm exits at the wage if the lower
+        bound of the continuation value at that w is above vx everywhere in the grid.
+        Infeasible economies cost a few linear solves instead of a full wage solve, and no feasible one is rejected.
+        The screen assumes a wage solve bracketed by [w_min, w_max] (brentq, analytic_newton); under newton,
+        whose root may lie outside it, no economy is rejected.
+        """
+        assert not self.alt_timing, 'screen is not applied to alternative timing right now.'
         if self.w_solver == "newton":
-            w, res = sp.optimize.newton(self.entry_clearing, self.w_ini, full_output=True, maxiter=self.max_iter_)
-        elif self.w_solver == "brentq":
-            w, res = sp.optimize.brentq(self.entry_clearing, self.w_min, self.w_max,
-                                        maxiter=self.max_iter_, full_output=True)
-        assert res.converged, "Failed to converge price!"
+            return None
+        stay_solve = self._factorize(self._policy_matrix(np.ones_like(self.s_vals)))
+
+        def entry_bounds(w):
+            v_lo, v_hi = self.value_bounds(w, stay_solve)
+            return np.sum(v_lo * self.nu) - self.ce, np.sum(v_hi * self.nu) - self.ce, v_lo
+
+        error_lo, error_hi, v_lo = entry_bounds(self.w_max)
+        if error_lo > 0:
+            return f"Entry value exceeds ce at w_max = {self.w_max}."
+        w_hi = self.w_max
+        if error_hi < 0:
+            error_lo, error_hi, _ = entry_bounds(self.w_min)
+            if error_hi < 0:
+                return f"Entry value falls short of ce at w_min = {self.w_min}."
+            # bisect for a lower upper bound of the wage
+            w_lo = self.w_min
+            for _ in range(bisect_steps):
+                w = (w_lo + w_hi) / 2
+                error_lo, error_hi, v = entry_bounds(w)
+                if error_hi < 0:
+                    w_hi, v_lo = w, v
+                else:
+                    w_lo = w
+        if (self.F @ v_lo)[0] >= self.vx:  # as solve_exit_decision, at the lowest productivity
+            return f"No exit at wages below {w_hi}."
+        return None
+
+    def solve_coarse(self):
+        """
+        Solve the wage on a grid of coarse_s_size with the same parameters, and keep its value function
+        interpolated in log productivity (both Tauchen grids span the same range) to start value iteration.
+        The coarse grid is solved by analytic Newton with policy iteration, which takes a few small linear solves.
+        Return the coarse wage.
+        """
+        assert type(self) is Hopenhayn, 'coarse grid is applied to Hopenhayn only right now.'
+        coarse = replace(self, s_size=self.coarse_s_size, coarse_s_size=0, screen=False, verbose=False,
+                         w_solver="analytic_newton", v_solver="policy", sparse_F=False)
+        w, v = coarse.solve_wage()
+        self._v_coarse = np.interp(np.log(self.s_vals), np.log(coarse.s_vals), v)
+        return w
+
+    def _wage_bracket(self, w):
+        # bracket of the entry clearing root around w, widened by factors of 4 up to [w_min, w_max];
+        # the ends are solved once, as brentq finds them again in _v_history
+        width = self.coarse_bracket
+        while True:
+            w_lo, w_hi = max(w / (1 + width), self.w_min), min(w * (1 + width), self.w_max)
+            if (w_lo, w_hi) == (self.w_min, self.w_max) or self.entry_clearing(w_lo) > 0 > self.entry_clearing(w_hi):
+                return w_lo, w_hi
+            width *= 4
+
+    def solve_wage(self,):
+        """
+        Solve the wage clearing entry by w_solver, and return it with the value function.
+        With coarse_s_size, the coarse solve gives the starting wage (bracket under brentq) and value;
+        if the coarse grid has no equilibrium, the wage is solved from w_ini and [w_min, w_max] as without it.
+        """
+        w_ini, w_min, w_max = self.w_ini, self.w_min, self.w_max
+        if self.coarse_s_size:
+            try:
+                w_ini = self.solve_coarse()
+                if self.w_solver == "brentq":
+                    w_min, w_max = self._wage_bracket(w_ini)
+            except (RuntimeError, ValueError):
+                self._v_coarse, w_ini = None, self.w_ini
+
+        if self.w_solver == "analytic_newton":
+            w = self.analytic_newton_wage(w_ini)  # raises ValueError / RuntimeError on failure as brentq
+        else:
+            if self.w_solver == "newton":
+                w, res = sp.optimize.newton(self.entry_clearing, w_ini, full_output=True, maxiter=self.max_iter_)
+            elif self.w_solver == "brentq":
+                w, res = sp.optimize.brentq(self.entry_clearing, w_min, w_max,
+                                            maxiter=self.max_iter_, full_output=True)
+            assert res.converged, "Failed to converge price!"
         v = self.value_func_iteration(w)
         return w, v
 
@@ -217,20 +573,41 @@ class Hopenhayn:
 
         return x, X
 
+    def _factorize(self, A):
+        """
+        Return a function solving A @ x = b, with A factorized once by sparse LU if A is sparse,
+        otherwise by dense LU.
+        """
+        if sp.sparse.issparse(A):
+            return sp.sparse.linalg.splu(sp.sparse.csc_array(A)).solve
+        lu = sp.linalg.lu_factor(A)
+        return lambda b: sp.linalg.lu_solve(lu, b)
+
     def solve_mu(self, m, X):
-        P_x = (self.F * (1 - X).reshape(self.s_size, 1)).T
+        """
+        Solve mu = P_x @ mu + m * nu, i.e. mu = m * (I - P_x)^(-1) @ nu, by a factorized linear solve.
+        The factorization only depends on X (not on X under alt_timing), so it is kept for the next call.
+        """
+        key = "alt_timing" if self.alt_timing else X.tobytes()
+        if self._mu_factor[0] != key:
+            if self.alt_timing:
+                P_x = self.F.T
+            else:
+                P_x = scale_rows(self.F, 1 - X).T
+
+                # eta for the case of BGP, if GE eta=0 and nothing changes
+                # delta for the case of exogenous exit
+                P_x = P_x * ((1 - self.delta) / (1 + self.eta))
 
-        # eta for the case of BGP, if GE eta=0 and nothing changes
-        # delta for the case of exogenous exit
-        P_x = P_x * ((1 - self.delta) / (1 + self.eta))
+            A = eye_like(self.F) - P_x
+            if self.mu_solver == "sparse" and not sp.sparse.issparse(A):
+                A = sp.sparse.csc_array(np.where(np.abs(A) < self.sparse_tol, 0, A))
+            self._mu_factor = (key, self._factorize(A))
 
-        I = np.eye(self.s_size)
-        temp = sp.linalg.inv(I - P_x)
-        mu = m * (temp @ self.nu)
+        mu = m * self._mu_factor[1](self.nu)
 
         if self.alt_timing:
-            temp = sp.linalg.inv(I - self.F.T)
-            mu = m * (temp @ self.nu) * (1 - X)
+            mu = mu * (1 - X)
         return mu
 
     def labor_market_clearing(self, m, mu_m1, w, n_vals, f_vals):
@@ -257,26 +634,53 @@ class Hopenhayn:
         error = L_s - L_d
         return error
 
-    def solve_m(self, w, X, n_vals, f_vals):
-        mu_m1 = self.solve_mu(1, X)
-
-        if self.m_solver == "newton":
-            m, res = sp.optimize.newton(
-                self.labor_market_clearing, self.m_ini,
-                args=(mu_m1, w, n_vals, f_vals), maxiter=self.max_iter_, full_output=True
-            )
-        elif self.m_solver == "brentq":
-            m, res = sp.optimize.brentq(
-                self.labor_market_clearing, self.m_min, self.m_max,
-                args=(mu_m1, w, n_vals, f_vals), maxiter=self.max_iter_, full_output=True
-            )
-
-        assert res.converged, "Failed to converge entrant mass!"
+    def solve_m_linear(self, args):
+        """
+        Solve labor_market_clearing(m, *args) = 0 in closed form assuming it is affine in m,
+        which holds as mu = m * mu_m1 (labor demand, output, profit and cost are all linear in m,
+        and labor supply is either constant in m or linear through profit).
+        Return None if the residual at the solution shows it is not affine.
+        """
+        error_0 = self.labor_market_clearing(0, *args)
+        error_1 = self.labor_market_clearing(1, *args)
+        if error_1 == error_0:
+            return None
+        m = error_0 / (error_0 - error_1)
+        if abs(self.labor_market_clearing(m, *args)) > self.tol * (1 + abs(error_0)):
+            return None
+        return m
+
+    def solve_m(self, w, X, n_vals, f_vals, mu_m1=None):
+        if mu_m1 is None:
+            mu_m1 = self.solve_mu(1, X)
+        args = (mu_m1, w, n_vals, f_vals)
+
+        # closed form first, m_solver only if labor market clearing is not linear in m
+        m = self.solve_m_linear(args)
+        if m is None:
+            if self.m_solver == "newton":
+                m, res = sp.optimize.newton(
+                    self.labor_market_clearing, self.m_ini,
+                    args=args, maxiter=self.max_iter_, full_output=True
+                )
+            elif self.m_solver == "brentq":
+                m, res = sp.optimize.brentq(
+                    self.labor_market_clearing, self.m_min, self.m_max,
+                    args=args, maxiter=self.max_iter_, full_output=True
+                )
+
+            assert res.converged, "Failed to converge entrant mass!"
 
         mu = m * mu_m1
         return m, mu
 
     def solve_model(self):
+        if self.screen:
+            reason = self.screen_feasibility()
+            if reason is not None:
+                if not self.suppress_fail:
+                    raise ValueError(reason)
+                return None
         try:
             w, v = self.solve_wage()
         except (RuntimeError, ValueError) as e:
@@ -299,10 +703,20 @@ class Hopenhayn:
                 print("Caution: there is no exit in the model")
             return None
 
+        return self.solve_stationary(w, v, x, X)
+
+    def _share_grids(self, res):
+        # mark the primitive grids of res that are still the shared grids of this model (not sparse, tiled or
+        # replaced, e.g. in HR), which compact storage of res drops and rebuilds, see Result
+        res._shared_grids = [name for name, grid in self._grids.items() if getattr(self, name) is grid]
+        return res
+
+    def solve_stationary(self, w, v, x, X, mu_m1=None):
+        # solve entrant mass and distribution given wage and exit decision, and gather the result
         n_vals = self.solve_employment(self.s_vals, w)
         f_vals = self.production_func(self.s_vals, n_vals)
 
-        m, mu = self.solve_m(w, X, n_vals, f_vals)
+        m, mu = self.solve_m(w, X, n_vals, f_vals, mu_m1=mu_m1)
         if m <= 0:
             if not self.suppress_fail:
                 raise ValueError("m converges to less 0 value.")
@@ -311,7 +725,7 @@ class Hopenhayn:
         if self.alt_timing:
             m = sum((1-X) * self.nu) * m  # entry mass exclude ones that exit immediately
 
-        return Result(
+        return self._share_grids(Result(
             w=w,
             v=v,
             x=x,
@@ -344,7 +758,212 @@ class Hopenhayn:
             # mode
             equilibrium=self.equilibrium,
             cf_in_labor=self.cf_in_labor,
-        )
+        ))
+
+
+@dataclass
+class HopenhaynBatch:
+    """
+    A class to solve many Hopenhayn economies sharing the grid size in one vectorized pass,
+    e.g. a population of parameter vectors in calibration.
+    Value functions are stacked into a (K, s_size) array, and the wages of all economies are solved together
+    by the safeguarded Newton iteration of Hopenhayn.analytic_newton_wage with policy iteration for the value,
+    so each result agrees with its own solve_model under w_solver="analytic_newton" up to tol.
+    Entrant mass and statistics are then solved economy by economy.
+    """
+    models: list
+
+    def __post_init__(self):
+
+        assert len(self.models) > 0, 'batch must include at least one model.'
+        assert all(type(model) is Hopenhayn for model in self.models), 'batch solves only Hopenhayn models.'
+        assert len({model.s_size for model in self.models}) == 1, 'models in batch must share s_size.'
+        assert not any(model.alt_timing for model in self.models), 'batch is not applied to alternative timing right now.'
+
+        def stack(name):
+            return np.array([getattr(model, name) for model in self.models], dtype=float)
+
+        self.K = len(self.models)
+        self.s_size = self.models[0].s_size
+        self.F = np.stack([model.F.toarray() if sp.sparse.issparse(model.F) else model.F for model in self.models])
+        self.s_vals = stack("s_vals")
+        self.nu = stack("nu")
+
+        # parameters as (K, 1) columns to broadcast over the grid
+        for name in ["beta", "theta", "ce", "cf", "delta", "vx", "eta", "cf_in_labor"]:
+            setattr(self, name, stack(name).reshape(-1, 1))
+        # the wage is scaled by tau_l * s**gamma_l only if gamma_l != 0, see Hopenhayn.solve_employment
+        gamma_l = stack("gamma_l").reshape(-1, 1)
+        tau_l = stack("tau_l").reshape(-1, 1)
+        self.w_unit = np.where(gamma_l != 0, tau_l * (self.s_vals**gamma_l), 1)
+
+        self.w_ini, self.w_min, self.w_max = stack("w_ini"), stack("w_min"), stack("w_max")
+
+        # iteration parameters follow the first model
+        self.tol = self.models[0].tol
+        self.max_iter = self.models[0].max_iter
+        self.max_iter_ = self.models[0].max_iter_
+
+    def profit_vals(self, w, idx):
+        # (k, s_size) employment, output and profit of economies idx at their wages w of shape (k,)
+        w_vals = w.reshape(-1, 1) * self.w_unit[idx]
+        theta, s_vals = self.theta[idx], self.s_vals[idx]
+        n_vals = (theta * s_vals / w_vals) ** (1 / (1 - theta))
+        f_vals = s_vals * (n_vals ** theta)
+        p_temp = np.where(self.cf_in_labor[idx], w_vals, 1)
+        pi_vals = f_vals - w_vals * n_vals - p_temp * self.cf[idx]
+        return n_vals, f_vals, pi_vals
+
+    def expectation(self, v, idx):
+        # F @ v for each economy
+        return np.matmul(self.F[idx], v[:, :, np.newaxis])[:, :, 0]
+
+    def solve_stay_decision(self, v, idx):
+        delta, vx = self.delta[idx], self.vx[idx]
+        integral = self.expectation(v, idx) * (1 - delta) + delta * vx
+        return integral >= vx
+
+    def _policy_matrix(self, stay, idx):
+        # I - beta * (1 - delta) * diag(stay) @ F for each economy, built in place
+        A = self.F[idx] * (- self.beta[idx] * (1 - self.delta[idx]) * stay)[:, :, np.newaxis]
+        diag = np.arange(self.s_size)
+        A[:, diag, diag] += 1
+        return A
+
+    def value_func_iteration(self, w, idx, v_ini=None):
+        """
+        Policy iteration as Hopenhayn with v_solver="policy" for economies idx,
+        starting from v_ini if given and solving only the economies not converged yet.
+        """
+        _, _, pi_vals = self.profit_vals(w, idx)
+        beta, delta, vx = self.beta[idx], self.delta[idx], self.vx[idx]
+
+        v = np.ones_like(pi_vals) if v_ini is None else v_ini.copy()
+        active = np.arange(len(idx))
+        i = 0
+
+        while i < self.max_iter and len(active) > 0:
+            sub = idx[active]
+            stay = self.solve_stay_decision(v[active], sub).astype(float)
+            b = pi_vals[active] + beta[active] * (stay * delta[active] + (1 - stay)) * vx[active]
+            v_new = np.linalg.solve(self._policy_matrix(stay, sub), b[:, :, np.newaxis])[:, :, 0]
+            error = np.max(np.abs(v[active] - v_new), axis=1)
+            v[active] = v_new
+            active = active[error > self.tol]
+            i += 1
+
+        if i == self.max_iter:
+            print("Failed to converge value!")
+
+        return v
+
+    def entry_clearing_prime(self, w, idx, v_ini=None):
+        # entry_clearing and its derivative in w, see Hopenhayn.value_derivative_wage, also return v
+        v = self.value_func_iteration(w, idx, v_ini)
+        stay = self.solve_stay_decision(v, idx).astype(float)
+        n_vals, _, _ = self.profit_vals(w, idx)
+        dpi_vals = - self.w_unit[idx] * (n_vals + self.cf_in_labor[idx] * self.cf[idx])
+        dv = np.linalg.solve(self._policy_matrix(stay, idx), dpi_vals[:, :, np.newaxis])[:, :, 0]
+        error = np.sum(v * self.nu[idx], axis=1) - self.ce[idx, 0]
+        d_error = np.sum(dv * self.nu[idx], axis=1)
+        return error, d_error, v
+
+    def solve_wage(self):
+        """
+        Vectorized Hopenhayn.analytic_newton_wage, iterating only on economies not converged yet
+        and warm starting each economy's value from its previous trial.
+        Return wages and values, with nan wage for economies without a root in [w_min, w_max] or not converging.
+        """
+        w_lo, w_hi = self.w_min.copy(), self.w_max.copy()
+        w = np.clip(self.w_ini, w_lo, w_hi)
+        w_out = np.full(self.K, np.nan)
+        v_out = np.ones_like(self.s_vals)
+
+        active = np.arange(self.K)
+        v_ini = None
+        for i in range(self.max_iter_):
+            if len(active) == 0:
+                break
+            w_a = w[active]
+            error, d_error, v = self.entry_clearing_prime(w_a, active, v_ini)
+            v_out[active] = v
+
+            w_lo[active] = np.where(error > 0, w_a, w_lo[active])
+            w_hi[active] = np.where(error < 0, w_a, w_hi[active])
+            lo, hi = w_lo[active], w_hi[active]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                w_new = np.where(d_error < 0, w_a - error / d_error, np.nan)
+            newton = (lo < w_new) & (w_new < hi)
+            scale = self.tol * (1 + np.abs(w_a))
+
+            # the same convergence and failure rule as Hopenhayn.analytic_newton_wage
+            converged = (error == 0) | (newton & (np.abs(w_new - w_a) <= scale))
+            failed = ~converged & ((~newton & (hi - lo <= scale)) | ~np.isfinite(error))
+            w_out[active[converged]] = np.where(error == 0, w_a, w_new)[converged]
+
+            w[active] = np.where(newton, w_new, (lo + hi) / 2)
+            keep = ~(converged | failed)
+            active = active[keep]
+            v_ini = v[keep]
+
+        # solve the value at the converged wage, as Hopenhayn.solve_wage, starting from the last trial
+        conv = np.flatnonzero(np.isfinite(w_out))
+        if len(conv) > 0:
+            v_out[conv] = self.value_func_iteration(w_out[conv], conv, v_ini=v_out[conv])
+        return w_out, v_out
+
+    def solve_exit_decision(self, v, idx):
+        # Hopenhayn.solve_exit_decision for economies idx, x_index is s_size if no exit threshold in grid
+        v_next = self.expectation(v, idx)
+        x_index = np.sum(v_next < self.vx[idx], axis=1)
+        X = np.where(np.arange(self.s_size) < x_index.reshape(-1, 1), 1, 0)
+        return x_index, X
+
+    def solve_mu(self, X, idx):
+        # unit-entry distributions, see Hopenhayn.solve_mu
+        P_x = np.transpose(self.F[idx] * (1 - X)[:, :, np.newaxis], (0, 2, 1))
+        P_x = P_x * ((1 - self.delta[idx]) / (1 + self.eta[idx]))[:, :, np.newaxis]
+        return np.linalg.solve(np.eye(self.s_size) - P_x, self.nu[idx][:, :, np.newaxis])[:, :, 0]
+
+    def solve_model(self):
+        """
+        Return the list of Result, with None for economies that fail,
+        as Hopenhayn.solve_model with suppress_fail.
+        """
+        results = [None] * self.K
+
+        w, v = self.solve_wage()
+        idx = np.flatnonzero(np.isfinite(w) & (w > 0))
+        if len(idx) == 0:
+            return results
+
+        x_index, X = self.solve_exit_decision(v[idx], idx)
+        valid = (x_index < self.s_size) & (X.sum(axis=1) > 0)
+        idx, x_index, X = idx[valid], x_index[valid], X[valid]
+        if len(idx) == 0:
+            return results
+        mu_m1 = self.solve_mu(X, idx)
+
+        for j, k in enumerate(idx):
+            model = self.models[k]
+            x = model.s_vals[x_index[j]]
+            try:
+                results[k] = model.solve_stationary(w[k], v[k], x, X[j], mu_m1=mu_m1[j])
+            except (RuntimeError, ValueError, AssertionError):
+                results[k] = None
+        return results
+
+
+def solve_batch(models):
+    # solve a list of Hopenhayn models in one vectorized pass, see HopenhaynBatch; models with screen
+    # rejected by screen_feasibility are not solved
+    results = [None] * len(models)
+    idx = [k for k, model in enumerate(models) if not model.screen or model.screen_feasibility() is None]
+    if idx:
+        for k, res in zip(idx, HopenhaynBatch([models[k] for k in idx]).solve_model()):
+            results[k] = res
+    return results
 
 
 @dataclass
@@ -381,99 +1000,295 @@ class Result():
     equilibrium: str
     cf_in_labor: int
 
-    def __post_init__(self, inherit=False):
+    # Compact storage: pickles (e.g. between processes of the calibration) and saved files keep only the fields,
+    # without cached statistics, and without the primitive grids built by shared_grids (as marked by
+    # Hopenhayn._share_grids), which are rebuilt on restore and shared by all results of the same grid parameters.
+
+    def _compact_state(self):
+        lazy = {name for klass in type(self).__mro__ for name, attr in vars(klass).items()
+                if isinstance(attr, cached_property)}
+        state = {k: v for k, v in self.__dict__.items() if k not in lazy}
+        shared = list(getattr(self, "_shared_grids", []))
+        for name in shared:
+            del state[name]
+        state["_shared_grids"] = shared
+        state["_grid_size"] = self.F.shape[0]
+        return state
+
+    def _restore_state(self, state):
+        state = dict(state)
+        shared, grid_size = list(state.get("_shared_grids", [])), state.pop("_grid_size", None)
+        if len(shared) > 0:
+            grids = shared_grids(*[state[name] for name in ["a", "rho", "sigma", "G_mu", "G_sigma"]], grid_size)
+            state.update({name: grids[name] for name in shared})
+        state["_shared_grids"] = shared
+        self.__dict__.update(state)
+
+    def __getstate__(self):
+        return self._compact_state()
+
+    def __setstate__(self, state):
+        self._restore_state(state)
+
+    def save(self, file, compress=True):
+        """
+        Save the fields of the result as .npz, in the compact form above.
+        Other attributes (e.g. in Result_HR) are rebuilt by load.
+        """
+        state = self._compact_state()
+        arrays = {}
+        for field in fields(self):
+            if field.name in state:
+                value = state[field.name]
+                if sp.sparse.issparse(value):  # e.g. F under sparse_F, kept in csr format
+                    value = sp.sparse.csr_array(value)
+                    for part in ["data", "indices", "indptr"]:
+                        arrays[f"{field.name}_csr_{part}"] = getattr(value, part)
+                else:
+                    arrays[field.name] = np.asarray(value)
+        arrays["_shared_grids"] = np.array(state["_shared_grids"], dtype=str)
+        arrays["_grid_size"] = np.array(state["_grid_size"])
+        (np.savez_compressed if compress else np.savez)(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file, allow_pickle=False) as data:
+            state = {name: data[name] if data[name].ndim else data[name].item() for name in data.files}
+        for name in [name[:-len("_csr_data")] for name in list(state) if name.endswith("_csr_data")]:
+            parts = [state.pop(f"{name}_csr_{part}") for part in ["data", "indices", "indptr"]]
+            state[name] = sp.sparse.csr_array(tuple(parts), shape=(len(parts[2]) - 1,) * 2)
+        res = cls.__new__(cls)
+        res._restore_state(state)
+        if hasattr(res, "__post_init__"):
+            res.__post_init__()
+        return res
+
+    # statistics are computed lazily on first access and then cached,
+    # so that e.g. calibration pays only for the moments it uses
+
+    @cached_property
+    def aggregate_firm_mass(self):
+        return np.sum(self.mu)
+
+    @cached_property
+    def w_vals(self):
+        return self.w * self.tau_l * (self.s_vals**self.gamma_l)
+
+    @cached_property
+    def mu_pmf(self):
+        return self.mu / self.aggregate_firm_mass
+
+    @cached_property
+    def n_vals_plus_cf(self):
+        return self.n_vals + self.cf
+
+    @cached_property
+    def aggregate_employment_production(self):
+        return np.sum(self.mu * self.n_vals)
+
+    @cached_property
+    def aggregate_employment_production_entrant(self):
+        return np.sum(self.m * self.nu * self.n_vals)
+
+    @cached_property
+    def aggregate_employment_overhead(self):
+        return self.cf * self.aggregate_firm_mass if self.cf_in_labor else None
+
+    @cached_property
+    def aggregate_employment_include_cf(self):
+        return np.sum(self.mu * self.n_vals_plus_cf) if self.cf_in_labor else None
+
+    @cached_property
+    def aggregate_employment_overhead_entrant(self):
+        return self.cf * self.m if self.cf_in_labor else None
+
+    @cached_property
+    def aggregate_employment_include_cf_entrant(self):
+        return np.sum(self.m * self.nu * self.n_vals_plus_cf) if self.cf_in_labor else None
+
+    @cached_property
+    def aggregate_output(self):
+        return np.sum(self.mu * self.f_vals)
+
+    @cached_property
+    def aggregate_profit(self):
+        p_temp = self.w_vals if self.cf_in_labor else 1
+        return self.aggregate_output - np.sum(self.w_vals * self.n_vals * self.mu
+                                              ) - np.sum(p_temp * self.cf * self.mu)  # - np.sum(self.ce * self.nu)
 
-        # calculate statistics
-        self.aggregate_firm_mass = np.sum(self.mu)
+    @cached_property
+    def aggregate_productivity(self):
+        return np.sum(self.mu_pmf * self.s_vals)
 
-        self.w_vals = self.w * self.tau_l * (self.s_vals**self.gamma_l)
-        p_temp = self.w_vals if self.cf_in_labor else 1
+    @cached_property
+    def aggregate_productivity_(self):
+        return self.aggregate_output / (self.aggregate_employment_production ** self.theta)
 
-        self.mu_pmf = self.mu / self.aggregate_firm_mass
-        self.n_vals_plus_cf = self.n_vals + self.cf
+    @cached_property
+    def aggregate_valuation(self):
+        return np.sum(self.mu_pmf * self.v)
 
-        self.aggregate_employment_production = np.sum(self.mu * self.n_vals)
-        self.aggregate_employment_production_entrant = np.sum(self.m * self.nu * self.n_vals)
-        if self.cf_in_labor:
-            self.aggregate_employment_overhead = self.cf * self.aggregate_firm_mass
-            self.aggregate_employment_include_cf = np.sum(self.mu * self.n_vals_plus_cf)
-            self.aggregate_employment_overhead_entrant = self.cf * self.m
-            self.aggregate_employment_include_cf_entrant = np.sum(
-                self.m * self.nu * self.n_vals_plus_cf)
-        else:
-            self.aggregate_employment_overhead = None
-            self.aggregate_employment_include_cf = None
-            self.aggregate_employment_overhead_entrant = None
-            self.aggregate_employment_include_cf_entrant = None
-
-        self.aggregate_output = np.sum(self.mu * self.f_vals)
-        self.aggregate_profit = self.aggregate_output - np.sum(self.w_vals * self.n_vals * self.mu
-                                                               ) - np.sum(p_temp * self.cf * self.mu)  # - np.sum(self.ce * self.nu)
-        self.aggregate_productivity = np.sum(self.mu_pmf * self.s_vals)
-        self.aggregate_productivity_ = self.aggregate_output / (self.aggregate_employment_production ** self.theta)
-        self.aggregate_valuation = np.sum(self.mu_pmf * self.v)
-
-        self.average_output = self.aggregate_output / self.aggregate_firm_mass
-        self.average_profit = self.aggregate_profit / self.aggregate_firm_mass
-        self.average_productivity = self.aggregate_productivity / self.aggregate_firm_mass
-        self.average_valuation = self.aggregate_valuation / self.aggregate_firm_mass
+    @cached_property
+    def average_output(self):
+        return self.aggregate_output / self.aggregate_firm_mass
 
+    @cached_property
+    def average_profit(self):
+        return self.aggregate_profit / self.aggregate_firm_mass
+
+    @cached_property
+    def average_productivity(self):
+        return self.aggregate_productivity / self.aggregate_firm_mass
+
+    @cached_property
+    def average_valuation(self):
+        return self.aggregate_valuation / self.aggregate_firm_mass
+
+    @cached_property
+    def entry_rate(self):
         # in BGP entry rate depends on the denominator be either this year mass or last year mass, in later case should * (1 + self.eta)
-        self.entry_rate = self.m / self.aggregate_firm_mass * 100 * (1 + self.eta)
-        self.exit_rate_no_delta = np.sum(self.X * self.mu_pmf) * 100
-        self.exit_rate = self.exit_rate_no_delta + (100 - self.exit_rate_no_delta) * self.delta
-        self.gross_turnover_rate = self.entry_rate + self.exit_rate
+        return self.m / self.aggregate_firm_mass * 100 * (1 + self.eta)
+
+    @cached_property
+    def exit_rate_no_delta(self):
+        return np.sum(self.X * self.mu_pmf) * 100
+
+    @cached_property
+    def exit_rate(self):
+        return self.exit_rate_no_delta + (100 - self.exit_rate_no_delta) * self.delta
+
+    @cached_property
+    def gross_turnover_rate(self):
+        return self.entry_rate + self.exit_rate
 
-        self.average_firm_size_prod = self.aggregate_employment_production / self.aggregate_firm_mass
-        self.average_entrant_size_prod = np.sum(self.nu * self.n_vals)
+    @cached_property
+    def average_firm_size_prod(self):
+        return self.aggregate_employment_production / self.aggregate_firm_mass
+
+    @cached_property
+    def average_entrant_size_prod(self):
+        return np.sum(self.nu * self.n_vals)
+
+    @cached_property
+    def _entrant_survivor_pdf(self):
         temp_pdf = self.nu * (1-self.X)
-        entrant_survivor_pdf = temp_pdf / temp_pdf.sum()
-        self.average_entrant_survivor_size_prod = np.sum(entrant_survivor_pdf * self.n_vals)
-        self.average_exitor_size_prod = np.sum(self.mu * self.X * self.n_vals) / np.sum(self.mu * self.X)
+        return temp_pdf / temp_pdf.sum()
 
-        if self.cf_in_labor:
-            self.average_firm_size_include_cf = self.aggregate_employment_include_cf / self.aggregate_firm_mass
-            self.average_entrant_size_include_cf = np.sum(self.nu * self.n_vals_plus_cf)
-            self.average_entrant_survivor_size_include_cf = np.sum(entrant_survivor_pdf * self.n_vals_plus_cf)
-            self.average_exitor_size_include_cf = np.sum(self.mu * self.X * self.n_vals_plus_cf
-                                                         ) / np.sum(self.mu * self.X)
-        else:
-            self.average_firm_size_include_cf = None
-            self.average_entrant_size_include_cf = None
-            self.average_entrant_survivor_size_include_cf = None
-            self.average_exitor_size_include_cf = None
+    @cached_property
+    def average_entrant_survivor_size_prod(self):
+        return np.sum(self._entrant_survivor_pdf * self.n_vals)
+
+    @cached_property
+    def average_exitor_size_prod(self):
+        return np.sum(self.mu * self.X * self.n_vals) / np.sum(self.mu * self.X)
 
+    @cached_property
+    def average_firm_size_include_cf(self):
+        return self.aggregate_employment_include_cf / self.aggregate_firm_mass if self.cf_in_labor else None
+
+    @cached_property
+    def average_entrant_size_include_cf(self):
+        return np.sum(self.nu * self.n_vals_plus_cf) if self.cf_in_labor else None
+
+    @cached_property
+    def average_entrant_survivor_size_include_cf(self):
+        return np.sum(self._entrant_survivor_pdf * self.n_vals_plus_cf) if self.cf_in_labor else None
+
+    @cached_property
+    def average_exitor_size_include_cf(self):
+        if not self.cf_in_labor:
+            return None
+        return np.sum(self.mu * self.X * self.n_vals_plus_cf) / np.sum(self.mu * self.X)
+
+    @cached_property
+    def x_mean(self):
         # in case of HR1993 with sxn 2-D states
-        self.x_mean = np.mean(self.x)
+        return np.mean(self.x)
+
+    # calculate growth rate
+    @cached_property
+    def _survival_stat_10(self):
+        return self.calculate_survival_stat(age=10)
+
+    @cached_property
+    def _survival_stat_20(self):
+        return self.calculate_survival_stat(age=20)
+
+    @cached_property
+    def lifecycle_survival_rate_10_year(self):
+        return self._survival_stat_10[0]
+
+    @cached_property
+    def lifecycle_growth_rate_10_year(self):
+        return self._survival_stat_10[1]
+
+    @cached_property
+    def lifecycle_survival_rate_20_year(self):
+        return self._survival_stat_20[0]
+
+    @cached_property
+    def lifecycle_growth_rate_20_year(self):
+        return self._survival_stat_20[1]
 
-        # calculate growth rate
-        self.lifecycle_survival_rate_10_year, self.lifecycle_growth_rate_10_year = self.calculate_survival_stat(age=10)
-        self.lifecycle_survival_rate_20_year, self.lifecycle_growth_rate_20_year = self.calculate_survival_stat(age=20)
+    # gather statistics, pandas objects are built only on access
+    @cached_property
+    def stat(self):
+        return self._stat()
 
-        # gather statistics
-        if not inherit:
-            self.stat = self._stat()
-            self.stat_size_dist = self._stat_size_dist()
+    @cached_property
+    def stat_size_dist(self):
+        return self._stat_size_dist()
 
     def check_valid(self):
         ...
 
+    @cached_property
+    def _cohort_P(self):
+        # transition of the surviving firms of a cohort, pdf at age a+1 = _cohort_P @ pdf at age a
+        return scale_rows(self.F, 1 - self.X).T * (1 - self.delta)
+
+    def _cohort_step(self, pdf):
+        return self._cohort_P @ pdf
+
+    @cached_property
+    def _cohort_pdfs(self):
+        # conditional pdfs of the entrant cohort from age 1, extended on demand by _cohort_step
+        return [self.nu]
+
+    def cohort_pdfs(self, horizon):
+        """
+        Conditional pdfs of the entrant cohort at ages 1..horizon.
+        The cohort is propagated forward once, with one matrix-vector product per age,
+        and the pdfs are kept so later calls for the same or younger ages cost nothing.
+        """
+        pdfs = self._cohort_pdfs
+        while len(pdfs) < horizon:
+            pdfs.append(self._cohort_step(pdfs[-1]))
+        return pdfs[:horizon]
+
     def calculate_cohort_conditional_pdf(self, age):
-        P_x = (self.F * (1 - self.X).reshape(len(self.X), 1)).T * (1 - self.delta)
-        conditional_pdf = np.linalg.matrix_power(P_x, age-1) @ self.nu
-        return conditional_pdf
+        return self.cohort_pdfs(age)[age-1]
 
-    def calculate_survival_stat(self, age=10):
-        conditional_pdf = self.calculate_cohort_conditional_pdf(age)
-        survival_rate = np.sum(conditional_pdf)
+    def cohort_path(self, horizon):
+        """
+        Survival rates and lifecycle growth rates (in %) of the entrant cohort for ages 1..horizon,
+        the same as calculate_survival_stat(age) for each age.
+        """
+        pdfs = np.array(self.cohort_pdfs(horizon))
+        axes = tuple(range(1, pdfs.ndim))  # sum over s (and n in HR)
+        survival_rate = np.sum(pdfs, axis=axes)
         if self.cf_in_labor:
-            life_growth_rate = np.sum(
-                conditional_pdf / survival_rate * self.n_vals_plus_cf) / self.average_entrant_size_include_cf
+            life_growth_rate = np.sum(pdfs * self.n_vals_plus_cf, axis=axes
+                                      ) / survival_rate / self.average_entrant_size_include_cf
         else:
-            life_growth_rate = np.sum(conditional_pdf / survival_rate * self.n_vals) / self.average_entrant_size_prod
+            life_growth_rate = np.sum(pdfs * self.n_vals, axis=axes) / survival_rate / self.average_entrant_size_prod
         life_growth_rate = life_growth_rate - 1
         return survival_rate*100, life_growth_rate*100
 
+    def calculate_survival_stat(self, age=10):
+        survival_rate, life_growth_rate = self.cohort_path(age)
+        return survival_rate[-1], life_growth_rate[-1]
+
     def _stat_base(self):
         df = pd.Series({
             'equilibrium': self.equilibrium,
@@ -520,42 +1335,53 @@ class Result():
         return df
 
     def _stat_size_dist(self,):
-
         n_threshold = [10, 30, 100, ]  # use 9,29,99?? // alternative: 5, 20, 50, 300
-
-        n_at = self.n_vals.searchsorted(n_threshold)
-        dist_num = [np.sum(g) * 100 for g in np.split(self.mu_pmf, n_at)]
-        dist_employ = [np.sum(g) * 100 / self.aggregate_employment_production for g in np.split(
-            self.mu * self.n_vals, n_at)]
-        dist_num_entrant = [np.sum(g) * 100 for g in np.split(self.nu, n_at)]
-        dist_employ_entrant = [np.sum(g) * 100 / self.aggregate_employment_production_entrant
-                               for g in np.split(self.m * self.nu * self.n_vals, n_at)]
-
+        return self.size_dist(n_threshold)
+
+    @cached_property
+    def _size_cumsums(self):
+        # for production size and size including cf: the sorted sizes, cumulative sums of
+        # firm pmf, employment, entrant pmf and entrant employment, and the employment totals
+        sizes = {"prod": (self.n_vals, self.aggregate_employment_production,
+                          self.aggregate_employment_production_entrant)}
         if self.cf_in_labor:
-            n_at_include_cf = (self.n_vals + self.cf).searchsorted(n_threshold)
-            dist_num_include_cf = [np.sum(g) * 100 for g in np.split(self.mu_pmf, n_at_include_cf)]
-            dist_employ_include_cf = [np.sum(g) * 100 / self.aggregate_employment_include_cf
-                                      for g in np.split(self.mu * self.n_vals_plus_cf, n_at_include_cf)]
-            dist_num_include_cf_entrant = [np.sum(g) * 100 for g in np.split(self.nu, n_at_include_cf)]
-            dist_employ_include_cf_entrant = [
-                np.sum(g) *100 / self.aggregate_employment_include_cf_entrant
-                for g in np.split(self.m * self.nu * self.n_vals_plus_cf, n_at_include_cf)]
-        else:
-            dist_num_include_cf = None
-            dist_employ_include_cf = None
-            dist_num_include_cf_entrant = None
-            dist_employ_include_cf_entrant = None
+            sizes["include_cf"] = (self.n_vals_plus_cf, self.aggregate_employment_include_cf,
+                                   self.aggregate_employment_include_cf_entrant)
+        cumsums = {}
+        for name, (n_vals, employment, employment_entrant) in sizes.items():
+            sorted_size, cumsum = size_cumsums(
+                n_vals, [self.mu_pmf, self.mu * n_vals, self.nu, self.m * self.nu * n_vals])
+            cumsums[name] = (sorted_size, cumsum, np.array([1, employment, 1, employment_entrant]))
+        return cumsums
+
+    def size_shares(self, n_threshold, size="include_cf"):
+        """
+        Array of number and employment shares (in %) of all firms and of entrants (rows) over the size bins
+        split at increasing n_threshold (columns), by size "prod" or "include_cf" (None if cf is not in labor).
+        Without building a DataFrame, e.g. for calibration moments.
+        """
+        if size not in self._size_cumsums:
+            return None
+        sorted_size, cumsum, total = self._size_cumsums[size]
+        return bin_sums(sorted_size, cumsum, n_threshold) * 100 / total.reshape(-1, 1)
+
+    def size_dist(self, n_threshold, sep="~"):
+        """
+        Number and employment shares (in %) of all firms and of entrants over the size bins split at
+        increasing n_threshold, by production employment and by employment including cf.
+        The grids may be 1-D (s) or 2-D (s x n in HR). Cumulative sums over the grid are computed once,
+        so each query with other thresholds costs only the bins, e.g. res.size_dist([5, 20, 50, 300]).
+        """
+        dist = {}
+        for name in ["prod", "include_cf"]:
+            rows = [f"num_{name}", f"emp_{name}", f"num_{name}_entrant", f"emp_{name}_entrant"]
+            shares = self.size_shares(n_threshold, name)
+            dist.update(zip(rows, [None] * len(rows) if shares is None else shares))
 
-        size_col = [str(a)+'~'+str(b) for a, b in zip(['']+n_threshold, n_threshold+[''])]
+        size_col = [str(a)+sep+str(b) for a, b in zip(['']+list(n_threshold), list(n_threshold)+[''])]
         df = pd.DataFrame({
-            'num_prod': dist_num,
-            'emp_prod': dist_employ,
-            'num_prod_entrant': dist_num_entrant,
-            'emp_prod_entrant': dist_employ_entrant,
-            'num_include_cf': dist_num_include_cf,
-            'emp_include_cf': dist_employ_include_cf,
-            'num_include_cf_entrant': dist_num_include_cf_entrant,
-            'emp_include_cf_entrant': dist_employ_include_cf_entrant,
+            k: dist[k] for k in ['num_prod', 'emp_prod', 'num_prod_entrant', 'emp_prod_entrant',
+                                 'num_include_cf', 'emp_include_cf', 'num_include_cf_entrant', 'emp_include_cf_entrant']
         }, index=size_col).T
         return df
 
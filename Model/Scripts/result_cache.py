@@ -0,0 +1,105 @@
+"""
+This code caches solved model results on disk, so that an economy solved by one script is reused by the others
+"""
+
+
+import os
+import json
+import hashlib
+import zipfile
+
+from hopenhayn import Result
+
+
+output_path_cache = "../Output/cache/"
+
+
+def code_version(*paths):
+    # hash of the source files the results depend on
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    A content-addressed cache of solved Result on disk.
+    Keys hash the parameter vector, model params and code version (the hashed sources fix the solver settings),
+    results are stored by Result.save as compressed .npz (a failed solve as an empty .none file),
+    and the least recently used files are removed when the cache exceeds max_bytes.
+    """
+
+    def __init__(self, path=output_path_cache, max_bytes=2 * 1024**3, version=""):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+
+    def key(self, x, model_params=None):
+        content = {
+            "x": [float(xi).hex() for xi in x],  # exact floats
+            "model_params": {k: repr(v) for k, v in sorted((model_params or {}).items())},
+            "version": self.version,
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def _file(self, key, failed=False):
+        return os.path.join(self.path, key + (".none" if failed else ".npz"))
+
+    def get(self, key):
+        """
+        Return (True, Result or None) if key is cached, else (False, None).
+        """
+        for failed in [False, True]:
+            file_path = self._file(key, failed)
+            if os.path.exists(file_path):
+                try:
+                    res = None if failed else Result.load(file_path)
+                    os.utime(file_path)  # mark as recently used
+                except FileNotFoundError:  # removed meanwhile, e.g. by evict or clear of another process
+                    return False, None
+                except (OSError, ValueError, KeyError, zipfile.BadZipFile):  # broken file, e.g. interrupted writing
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                    return False, None
+                return True, res
+        return False, None
+
+    def put(self, key, res):
+        os.makedirs(self.path, exist_ok=True)
+        file_path = self._file(key, res is None)
+        # write to a temporary file and rename, so that other processes never read a partial file
+        temp_path = file_path + f".{os.getpid()}.tmp"
+        if res is None:
+            open(temp_path, "w").close()
+        else:
+            with open(temp_path, "wb") as f:
+                res.save(f)
+        os.replace(temp_path, file_path)
+        self.evict()
+
+    def evict(self):
+        # remove least recently used files until the cache fits in max_bytes
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith((".npz", ".none")):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if entry.name.endswith((".npz", ".none", ".tmp")):
+                    os.remove(entry.path)
@@ -0,0 +1,178 @@
+"""
+This code minimizes an expensive objective by a Gaussian process surrogate and expected improvement
+"""
+
+
+import numpy as np
+import scipy as sp
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a Matern 5/2 kernel and a length scale per dimension.
+    Inputs are scaled to the unit cube by bounds and outputs are standardized; the kernel hyperparameters
+    (length scales, signal and noise variance) maximize the marginal likelihood.
+    """
+
+    def __init__(self, bounds):
+        self.lb, self.ub = np.array(bounds, dtype=float).T
+        self.theta = np.concatenate([np.full(len(self.lb), np.log(0.3)), [0, np.log(1e-4)]])
+        self.theta_bounds = [(np.log(0.01), np.log(10))] * len(self.lb) + [(np.log(0.01), np.log(100)), (np.log(1e-8), np.log(1))]
+
+    def _unit(self, xs):
+        return (np.atleast_2d(xs) - self.lb) / (self.ub - self.lb)
+
+    def _kernel(self, X1, X2, theta):
+        length_scale, signal = np.exp(theta[:-2]), np.exp(theta[-2])
+        r = np.sqrt(np.maximum(sp.spatial.distance.cdist(X1 / length_scale, X2 / length_scale, "sqeuclidean"), 0))
+        return signal * (1 + np.sqrt(5) * r + 5 / 3 * r**2) * np.exp(-np.sqrt(5) * r)
+
+    def _factor(self, theta):
+        K = self._kernel(self.X, self.X, theta) + (np.exp(theta[-1]) + 1e-10) * np.eye(len(self.X))
+        L = sp.linalg.cholesky(K, lower=True)
+        alpha = sp.linalg.cho_solve((L, True), self.y)
+        return L, alpha
+
+    def _neg_log_likelihood(self, theta):
+        try:
+            L, alpha = self._factor(theta)
+        except np.linalg.LinAlgError:
+            return 1e10
+        return 0.5 * self.y @ alpha + np.sum(np.log(np.diag(L)))
+
+    def fit(self, xs, ys, optimize=True):
+        self.X = self._unit(xs)
+        ys = np.asarray(ys, dtype=float)
+        self.y_mean, self.y_std = ys.mean(), ys.std() if ys.std() > 0 else 1.0
+        self.y = (ys - self.y_mean) / self.y_std
+        if optimize:
+            res = sp.optimize.minimize(self._neg_log_likelihood, self.theta, method="L-BFGS-B", bounds=self.theta_bounds)
+            if res.fun < self._neg_log_likelihood(self.theta):
+                self.theta = res.x
+        self._L, self._alpha = self._factor(self.theta)
+        return self
+
+    def predict(self, xs):
+        # mean and standard deviation at each row of xs
+        K_s = self._kernel(self._unit(xs), self.X, self.theta)
+        mu = K_s @ self._alpha
+        v = sp.linalg.solve_triangular(self._L, K_s.T, lower=True)
+        var = np.maximum(np.exp(self.theta[-2]) - np.sum(v**2, axis=0), 1e-12)
+        return mu * self.y_std + self.y_mean, np.sqrt(var) * self.y_std
+
+
+def expected_improvement(mu, sd, best, xi=0.01):
+    # expected improvement of minimization below best
+    z = (best - xi - mu) / sd
+    return (best - xi - mu) * sp.stats.norm.cdf(z) + sd * sp.stats.norm.pdf(z)
+
+
+def propose(gp, best, rng, n_candidates=2000, n_starts=5):
+    """
+    Return the point maximizing expected improvement: evaluate it at random candidates, half of them around the
+    best evaluated points, and polish the best candidates by L-BFGS-B.
+    """
+    d = len(gp.lb)
+    width = gp.ub - gp.lb
+    top = gp.X[np.argsort(gp.y)[:5]] * width + gp.lb
+    candidates = np.vstack([
+        gp.lb + rng.random((n_candidates // 2, d)) * width,
+        np.clip(top[rng.integers(len(top), size=n_candidates // 2)] + 0.05 * width * rng.standard_normal((n_candidates // 2, d)), gp.lb, gp.ub),
+    ])
+    neg_ei = lambda xs: -expected_improvement(*gp.predict(xs), best)
+    ei = neg_ei(candidates)
+    x_best, f_best = candidates[np.argmin(ei)], ei.min()
+    for x0 in candidates[np.argsort(ei)[:n_starts]]:
+        res = sp.optimize.minimize(lambda x: neg_ei(x)[0], x0, method="L-BFGS-B", bounds=list(zip(gp.lb, gp.ub)))
+        if res.fun < f_best:
+            x_best, f_best = res.x, res.fun
+    return x_best
+
+
+def select_points(xs, ys, bounds, max_points, n_best=None):
+    """
+    Return the indices of at most max_points rows of xs to fit the surrogate on, as the exact fit is cubic in the
+    points: the n_best (by default half) of lowest ys, and a space-filling subsample of the others, each picked
+    as the farthest (in the unit cube) from the points picked before.
+    """
+    if len(xs) <= max_points:
+        return np.arange(len(xs))
+    n_best = max_points // 2 if n_best is None else n_best
+    lb, ub = np.array(bounds, dtype=float).T
+    order = np.argsort(ys, kind="stable")
+    chosen, rest = list(order[:n_best]), order[n_best:]
+    unit = (xs[rest] - lb) / (ub - lb)
+    dist = np.full(len(rest), np.inf)
+    for x in (xs[chosen] - lb) / (ub - lb):
+        dist = np.minimum(dist, np.linalg.norm(unit - x, axis=1))
+    for _ in range(max_points - n_best):
+        i = np.argmax(dist)
+        chosen.append(rest[i])
+        dist = np.minimum(dist, np.linalg.norm(unit - unit[i], axis=1))
+    return np.array(chosen)
+
+
+def surrogate_minimize(func, bounds, xs=None, ys=None, n_init=None, maxfev=200, batch=1, penalty=1e7, rng=None,
+                       callback=None, max_points=300,):
+    """
+    Minimize func over bounds by Bayesian optimization: fit a GaussianProcess to the log objective of the points
+    evaluated so far and evaluate func only at the points of largest expected improvement, batch points a round.
+    func
+        - vectorized objective: func(xs) with xs of shape (len(x), S) returns the S objectives,
+          as passed by differential_evolution(vectorized=True)
+    xs, ys
+        - points evaluated before, e.g. read from a search trace, and their objectives
+    n_init
+        - points evaluated before the first fit (Latin hypercube, counting xs), by default 10 per dimension
+    maxfev
+        - new evaluations of func, including the initial ones
+    penalty
+        - objectives from this value up mark failed evaluations; the surrogate sees them as the worst success,
+          so that they repel the search without distorting the fit
+    max_points
+        - points the surrogate is fitted on each round, selected from all evaluated ones by select_points,
+          so that many start points (e.g. a differential evolution trace) and long searches stay cheap
+    batch points per round are proposed by the "kriging believer": each proposed point is added to the surrogate
+    at its predicted mean before proposing the next, so that the batch spreads over different regions.
+    """
+    rng = np.random.default_rng(rng)
+    d = len(bounds)
+    lb, ub = np.array(bounds, dtype=float).T
+    xs = np.empty((0, d)) if xs is None else np.atleast_2d(np.asarray(xs, dtype=float))
+    ys = np.empty(0) if ys is None else np.asarray(ys, dtype=float)
+    n_init = 10 * d if n_init is None else n_init
+    nfev = 0
+
+    def evaluate(new_xs):
+        nonlocal xs, ys, nfev
+        new_ys = np.asarray(func(new_xs.T), dtype=float)
+        xs, ys = np.vstack([xs, new_xs]), np.concatenate([ys, new_ys])
+        nfev += len(new_xs)
+
+    if len(xs) < n_init:
+        size = min(n_init - len(xs), maxfev)
+        evaluate(sp.stats.qmc.scale(sp.stats.qmc.LatinHypercube(d=d, rng=rng).random(size), lb, ub))
+
+    gp = GaussianProcess(bounds)
+    nit = 0
+    while nfev < maxfev:
+        ok = ys < penalty
+        if not ok.any():  # no successful evaluation to fit, sample at random
+            evaluate(lb + rng.random((min(batch, maxfev - nfev), d)) * (ub - lb))
+            continue
+        log_ys = np.log(np.where(ok, ys, ys[ok].max()) + 1e-12)
+        fit = select_points(xs, log_ys, bounds, max_points)
+        gp.fit(xs[fit], log_ys[fit])
+        proposed = []
+        for i in range(min(batch, maxfev - nfev)):
+            if i > 0:
+                p = np.array(proposed)
+                gp.fit(np.vstack([xs[fit], p]), np.concatenate([log_ys[fit], gp.predict(p)[0]]), optimize=False)
+            proposed.append(propose(gp, log_ys.min(), rng))
+        evaluate(np.array(proposed))
+        nit += 1
+        if callback is not None and callback(xs[np.argmin(ys)], ys.min()):
+            break
+
+    i = np.argmin(ys)
+    return sp.optimize.OptimizeResult(x=xs[i], fun=ys[i], nfev=nfev, nit=nit, xs=xs, ys=ys)
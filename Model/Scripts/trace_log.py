@@ -0,0 +1,70 @@
+"""
+This code writes and reads the trace of calibration searches
+"""
+
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class TraceWriter:
+    """
+    A buffered writer of the evaluations of a calibration search to a csv file, one row per evaluation with
+    kind of row, time, parameters (param_*), objective, normalized error of each moment (error_*) and solve time.
+    Lines starting with "#" before the header hold the search information.
+    Rows are appended in batches of batch_size, each batch by a single write to the file opened in append mode,
+    so the file can be tailed while the search runs and lines of concurrent writers never interleave.
+    Copies of the writer in other processes (e.g. scipy workers) write each row at once.
+    append: if True and the file exists, e.g. for a resumed search, add rows to it instead of starting a new file.
+    """
+
+    def __init__(self, file_path, param_names, moment_names, info=(), batch_size=1000, append=False):
+        self.file_path = file_path
+        self.columns = (["kind", "time"] + [f"param_{n}" for n in param_names] + ["objective"]
+                        + [f"error_{n}" for n in moment_names] + ["solve_time"])
+        self.n_moments = len(moment_names)
+        self.batch_size = batch_size
+        self._buffer = []
+        if append and os.path.exists(file_path):
+            return
+        with open(file_path, "w") as file:
+            file.write("".join(f"# {line}\n" for line in info) + ",".join(self.columns) + "\n")
+
+    def record(self, x, objective, errors=None, solve_time=np.nan, kind="eval"):
+        errors = np.full(self.n_moments, np.nan) if errors is None else errors
+        values = [kind, time.time(), *x, objective, *errors, solve_time]
+        self._buffer.append(",".join("" if v is None else str(v) for v in values) + "\n")
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            data = "".join(self._buffer).encode()
+            self._buffer = []
+            fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        self.flush()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_buffer"] = []
+        state["batch_size"] = 1
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_trace(file_path):
+    return pd.read_csv(file_path, comment="#")